@@ -1,67 +1,540 @@
 import os
-import time
+import io
 import csv
+import argparse
+import html
+import asyncio
+import json
+import time
+import threading
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 import pandas as pd
 import numpy as np
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import datetime
+from posner.data import PARTIAL_SUFFIX, SessionStore, read_partial_csv, read_session
+from posner.stats import MIN_RT, participant_stats
 
 DATA_DIR = "data"
 LEADERBOARD_FILE = "leaderboard.csv"
+HTML_FILE = "leaderboard.html"
+METRICS_CACHE_FILE = "leaderboard_cache.json"
+# Bump when compute_metrics changes, cached metrics of other versions are recomputed
+METRICS_CACHE_VERSION = 2
+LEADERBOARD_COLUMNS = ['Participant', 'Response Time (s)', 'Response Time Valid Cues (s)',
+                       'Response Time Invalid Cues (s)', 'Response Time Difference (s)', 'Accuracy']
+SNAPSHOT_DELAY = 1.0 # Seconds between an update and writing the leaderboard file
+SETTLE_TIME = 0.25 # Seconds without file events before a file counts as written
+WORKERS = 8
+POLL_INTERVAL = 1.0 # Seconds between queries when reading from a session database
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+KEEPALIVE_INTERVAL = 15.0 # Seconds between comments that keep idle event streams open
+MAX_PENDING_MESSAGES = 1000
+MEDALS = ['gold', 'silver', 'bronze']
+JSON_KEYS = ['participant', 'response_time', 'response_time_valid', 'response_time_invalid',
+             'response_time_difference', 'accuracy']
+
+class Leaderboard:
+    """In-memory leaderboard that stays sorted by response time.
+
+    Rows are kept in a dict keyed by participant and the ranking in a sorted
+    list, so an update is a bisect instead of a round-trip through the CSV
+    file. The file is written by a background timer at most once every
+    `snapshot_delay` seconds.
+    """
+
+    def __init__(self, path=LEADERBOARD_FILE, snapshot_delay=SNAPSHOT_DELAY):
+        self.path = path
+        self.snapshot_delay = snapshot_delay
+        self.rows = {}
+        self._ranking = []
+        self._lock = threading.RLock()
+        self._timer = None
+        self._listeners = []
+        if os.path.exists(path):
+            existing = pd.read_csv(path, dtype={'Participant': str})
+            for row in existing[LEADERBOARD_COLUMNS].itertuples(index=False):
+                self._insert(tuple(row))
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _sort_key(row):
+        # Sort by response time with missing values last, like sort_values
+        response_time = row[1]
+        if pd.isna(response_time):
+            return (1, 0.0, row[0])
+        return (0, response_time, row[0])
+
+    def _insert(self, row):
+        old = self.rows.get(row[0])
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, self._sort_key(old))]
+        self.rows[row[0]] = row
+        insort(self._ranking, self._sort_key(row))
+
+    def subscribe(self, callback):
+        """Call `callback` with the changed rows after every update"""
+        self._listeners.append(callback)
+
+    def _notify(self, rows):
+        for callback in self._listeners:
+            callback(rows)
+
+    def update(self, participant_id, avg_response_time, avg_response_time_valid,
+               avg_response_time_invalid, response_time_difference, accuracy):
+        row = (participant_id, avg_response_time, avg_response_time_valid,
+               avg_response_time_invalid, response_time_difference, accuracy)
+        with self._lock:
+            self._insert(row)
+            self._notify([row])
+            if self._timer is None:
+                self._timer = threading.Timer(self.snapshot_delay, self.snapshot)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def update_many(self, rows):
+        """Add or update several participants with one snapshot"""
+        rows = [tuple(row) for row in rows]
+        with self._lock:
+            for row in rows:
+                self._insert(row)
+            self._notify(rows)
+            self.snapshot()
+
+    def sorted_rows(self):
+        with self._lock:
+            return [self.rows[key[2]] for key in self._ranking]
+
+    def to_frame(self):
+        return pd.DataFrame(self.sorted_rows(), columns=LEADERBOARD_COLUMNS)
+
+    def snapshot(self):
+        """Write the leaderboard to disk, replacing the old file in one step"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            leaderboard = self.to_frame()
+        tmp_path = self.path + ".tmp"
+        leaderboard.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+_leaderboard = None
+
+def get_leaderboard():
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = Leaderboard()
+    return _leaderboard
+
+def row_to_json(row):
+    # Missing values become null, NaN is not valid JSON
+    return {key: (None if isinstance(value, float) and np.isnan(value) else value)
+            for key, value in zip(JSON_KEYS, row)}
+
+class LeaderboardServer:
+    """Local HTTP server that pushes leaderboard changes to browsers.
+
+    `/ranking` returns all rows in ranked order as JSON and `/events` is a
+    Server-Sent Events stream that starts with all rows and then sends only
+    the rows that changed whenever the leaderboard is updated. `/` serves a
+    page that follows the stream, so any number of screens stay current
+    without reading files, and resync whenever they reconnect.
+    """
+
+    def __init__(self, leaderboard, host=SERVER_HOST, port=SERVER_PORT):
+        self.leaderboard = leaderboard
+        self.host = host
+        self.port = port
+        self.ready = threading.Event()
+        self.error = None
+        self._clients = set()
+        self._loop = None
+
+    def start(self):
+        """Serve from a background thread and return once the server listens
+
+        Raises the error of the server thread if it stopped before listening,
+        for example because the port is already in use.
+        """
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return thread
+
+    def _run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as error:
+            self.error = error
+        finally:
+            # Never leave start() waiting for a server that is gone
+            self.ready.set()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.leaderboard.subscribe(self.publish)
+        print(f"Serving the live leaderboard at http://{self.host}:{self.port}/")
+        self.ready.set()
+        async with server:
+            await server.serve_forever()
+
+    @staticmethod
+    def _message(rows):
+        return f"data: {json.dumps([row_to_json(row) for row in rows])}\n\n".encode()
+
+    def publish(self, rows):
+        # Called from the threads that update the leaderboard
+        self._loop.call_soon_threadsafe(self._broadcast, self._message(rows))
+
+    def _broadcast(self, message):
+        for client in list(self._clients):
+            if client.qsize() > MAX_PENDING_MESSAGES:
+                # Drop viewers that stopped reading instead of buffering forever
+                self._clients.discard(client)
+            else:
+                client.put_nowait(message)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else ""
+            if path == "/events":
+                await self._stream_events(writer)
+            elif path == "/ranking":
+                body = json.dumps([row_to_json(row) for row in self.leaderboard.sorted_rows()])
+                await self._respond(writer, "200 OK", "application/json", body.encode())
+            elif path == "/":
+                await self._respond(writer, "200 OK", "text/html; charset=utf-8", LIVE_PAGE.encode())
+            else:
+                await self._respond(writer, "404 Not Found", "text/plain", b"Not found")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _stream_events(self, writer):
+        client = asyncio.Queue()
+        # Registered together with the full ranking on the loop thread, so
+        # every later update is either in the ranking or broadcast after it
+        self._clients.add(client)
+        client.put_nowait(self._message(self.leaderboard.sorted_rows()))
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+            await writer.drain()
+            while client in self._clients:
+                try:
+                    message = await asyncio.wait_for(client.get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    message = b": keep-alive\n\n"
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self._clients.discard(client)
+
+class RunningMean:
+    """Mean and variance updated one value at a time with Welford's algorithm"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        # Missing values are skipped like pandas does
+        if np.isnan(value):
+            return
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def value(self):
+        return self.mean if self.n else np.nan
+
+    @property
+    def variance(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else np.nan
+
+class ParticipantStats:
+    """Leaderboard metrics of a participant, updated with every trial"""
+
+    def __init__(self):
+        self.response_time = RunningMean()
+        self.response_time_valid = RunningMean()
+        self.response_time_invalid = RunningMean()
+        self.n_trials = 0
+        self.n_correct = 0
+
+    def add(self, trial):
+        self.n_trials += 1
+        if trial['response'] != trial['side']:
+            return
+        self.n_correct += 1
+        # Anticipations don't count for the RTs, like in posner.stats
+        response_time = parse_float(trial['response_time'])
+        if not response_time >= MIN_RT:
+            return
+        self.response_time.add(response_time)
+        if trial['valid'] == 'True':
+            self.response_time_valid.add(response_time)
+        else:
+            self.response_time_invalid.add(response_time)
+
+    def metrics(self):
+        valid = self.response_time_valid.value
+        invalid = self.response_time_invalid.value
+        accuracy = self.n_correct / self.n_trials if self.n_trials else np.nan
+        return (self.response_time.value, valid, invalid, invalid - valid, accuracy)
+
+def parse_float(text):
+    # Trials without a response have an empty response time
+    return float(text) if text else np.nan
+
+class TrialTail:
+    """Reads the trials appended to a CSV file since the last read"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.fieldnames = None
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        # A trial that is only partly written is read the next time
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        lines = data[:end].decode().splitlines()
+        if self.fieldnames is None and lines:
+            self.fieldnames = next(csv.reader(lines[:1]))
+            lines = lines[1:]
+        return list(csv.DictReader(lines, fieldnames=self.fieldnames))
 
 class ExperimentHandler(FileSystemEventHandler):
+    """Process participant data once their CSV file is completely written.
+
+    Events are collected per participant directory. A file that was closed
+    or renamed into place is processed right away, other files once no event
+    arrived for `settle_time` seconds and their size stopped changing. The
+    processing runs on a pool of worker threads, so many participants that
+    finish at once don't wait for each other.
+
+    Sessions that are still running stream their trials into a .part file.
+    Those files are tailed and every new trial updates the participant's
+    running metrics, so the leaderboard changes during the session and the
+    finished file doesn't have to be read again.
+    """
+
+    def __init__(self, settle_time=SETTLE_TIME, workers=WORKERS):
+        super().__init__()
+        self.settle_time = settle_time
+        self._pending = {} # participant_dir -> [path, time of last event, size]
+        self._streams = {} # participant_dir -> [TrialTail, ParticipantStats]
+        self._streamed = {} # participant_dir -> whether the session has ended
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
     def on_created(self, event):
         if event.is_directory:
             return
-        if not event.src_path.endswith('.csv'):
+        self.handle_file(event.src_path)
+
+    def on_modified(self, event):
+        if event.is_directory:
             return
-        time.sleep(2) # Wait to ensure file written
-        
-        # Get the participant directory and ID
-        participant_dir = os.path.dirname(event.src_path)
-        participant_id = os.path.basename(participant_dir)
-        
-        # Process the participant data
-        process_participant_data(participant_id, participant_dir)
-        # Update the leaderboard display
-        update_leaderboard_display()
+        self.handle_file(event.src_path)
+
+    def on_closed(self, event):
+        if event.is_directory:
+            return
+        self.handle_file(event.src_path, complete=True)
+
+    def on_moved(self, event):
+        # The experiment streams into a .part file and renames it when the session ends
+        if event.is_directory:
+            return
+        self.handle_file(event.dest_path, complete=True)
+
+    def handle_file(self, path, complete=False):
+        # Only the trial data counts, not traces or other files of the participant
+        participant_dir = os.path.dirname(path)
+        data_file = os.path.basename(participant_file(os.path.basename(participant_dir), participant_dir))
+        if os.path.basename(path) == data_file + PARTIAL_SUFFIX:
+            self.handle_trials(path)
+            return
+        if os.path.basename(path) != data_file:
+            return
+        with self._lock:
+            if complete and participant_dir in self._streams:
+                # The streamed file was renamed into place, only its last trials are new
+                self._streams[participant_dir][0].path = path
+                self._streamed[participant_dir] = True
+            else:
+                self._pending[participant_dir] = [path, None if complete else time.monotonic(), None]
+        if complete:
+            self._wakeup.set()
+
+    def handle_trials(self, path):
+        participant_dir = os.path.dirname(path)
+        with self._lock:
+            if participant_dir not in self._streams:
+                self._streams[participant_dir] = [TrialTail(path), ParticipantStats()]
+            self._streamed.setdefault(participant_dir, False)
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _ready(self):
+        # Pop the participants whose files have settled
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for participant_dir, pending in list(self._pending.items()):
+                path, last_event, last_size = pending
+                if last_event is not None:
+                    if now - last_event < self.settle_time:
+                        continue
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        del self._pending[participant_dir]
+                        continue
+                    if size != last_size:
+                        # Check again after another settle time
+                        pending[1:] = [now, size]
+                        continue
+                ready.append(participant_dir)
+                del self._pending[participant_dir]
+        return ready
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.settle_time / 4)
+            self._wakeup.clear()
+            streamed = self._read_streams()
+            ready = self._ready()
+            if not ready:
+                if streamed:
+                    update_leaderboard_display()
+                continue
+            futures = [
+                self._executor.submit(
+                    process_participant_data, os.path.basename(participant_dir), participant_dir)
+                for participant_dir in ready
+            ]
+            wait(futures)
+            # Update the leaderboard display once for the whole batch
+            update_leaderboard_display()
+
+    def _read_streams(self):
+        # Add the new trials of running sessions to their metrics
+        with self._lock:
+            streamed, self._streamed = self._streamed, {}
+        updated = False
+        for participant_dir, ended in streamed.items():
+            tail, stats = self._streams[participant_dir]
+            try:
+                trials = tail.read()
+            except OSError:
+                # Renamed since the event, the rename event reads the rest
+                continue
+            for trial in trials:
+                stats.add(trial)
+            if trials:
+                update_leaderboard(os.path.basename(participant_dir), *stats.metrics())
+                updated = True
+            if ended:
+                with self._lock:
+                    del self._streams[participant_dir]
+        return updated
+
+def participant_file(participant_id, participant_dir):
+    return os.path.join(participant_dir, f"{participant_id}_data.csv")
+
+def finished_file(participant_id, participant_dir):
+    """The file a finished session's trials are read from, None while it is running"""
+    session_path = os.path.join(participant_dir, f"{participant_id}_data.parquet")
+    if os.path.exists(session_path):
+        # Typed session file, preferred over the CSV
+        return session_path
+    file_path = participant_file(participant_id, participant_dir)
+    if os.path.exists(file_path):
+        return file_path
+    return None
+
+def read_participant_data(participant_id, participant_dir):
+    """Read a participant's trials, or the trials written so far if the session is still running"""
+    file_path = participant_file(participant_id, participant_dir)
+    finished_path = finished_file(participant_id, participant_dir)
+    if finished_path is not None and finished_path.endswith('.parquet'):
+        return read_session(finished_path)[0]
+    if finished_path is not None:
+        return pd.read_csv(finished_path)
+    if os.path.exists(file_path + PARTIAL_SUFFIX):
+        text = read_partial_csv(file_path + PARTIAL_SUFFIX)
+        if text.count("\n") < 2:
+            print(f"No complete trials yet: {file_path + PARTIAL_SUFFIX}")
+            return None
+        return pd.read_csv(io.StringIO(text))
+    print(f"File not found: {file_path}")
+    return None
+
+def correct_responses(df):
+    """Whether the response of each trial was correct"""
+    if df['response'].dtype == bool:
+        # Older data stored whether the response was correct
+        return df['response']
+    return df['response'].astype(object) == df['side'].astype(object)
+
+def compute_metrics(df):
+    # Mean RTs of the correct responses, without timeouts and anticipations
+    stats = participant_stats(df.assign(participant='', correct=correct_responses(df))).iloc[0]
+    return (stats['mean_rt'], stats['mean_rt_valid'], stats['mean_rt_invalid'],
+            stats['mean_rt_invalid'] - stats['mean_rt_valid'], stats['accuracy'])
+
+def compute_participant_metrics(participant_id, participant_dir):
+    df = read_participant_data(participant_id, participant_dir)
+    if df is None:
+        return None
+    return compute_metrics(df)
 
 def process_participant_data(participant_id, participant_dir):
     try:
-        file_path = os.path.join(participant_dir, f"{participant_id}_data.csv")
-        print(f"Processing file: {file_path}")
-        
-        if not os.path.exists(file_path):
-            print(f"File not found: {file_path}")
+        print(f"Processing file: {participant_file(participant_id, participant_dir)}")
+        metrics = compute_participant_metrics(participant_id, participant_dir)
+        if metrics is None:
             return
-            
-        df = pd.read_csv(file_path)
-        
-        # Print column names and first few rows for debugging
-        print(f"Columns: {df.columns.tolist()}")
-        print(f"First few rows:\n{df.head()}")
-        
-        # Calculate task performance
-        avg_response_time = df['response_time'].mean()
-        avg_response_time_valid = df[df['valid']==True]['response_time'].mean()
-        avg_response_time_invalid = df[df['valid']==False]['response_time'].mean()
-        response_time_difference = avg_response_time_invalid - avg_response_time_valid
-        
-        # Check if response column is boolean
-        if df['response'].dtype != bool:
-            print(f"Warning: 'response' column is not boolean, attempting to convert")
-            # Try to convert to boolean if it's strings like 'True'/'False'
-            try:
-                if df['response'].dtype == object:  # string type
-                    df['response'] = df['response'].map({'True': True, 'False': False})
-                else:
-                    df['response'] = df['response'].astype(bool)
-            except Exception as e:
-                print(f"Error converting response column: {e}")
-        
-        # Calculate accuracy
-        accuracy = df['response'].mean()
+        (avg_response_time, avg_response_time_valid, avg_response_time_invalid,
+         response_time_difference, accuracy) = metrics
         
         print(f"Calculated metrics for {participant_id}:")
         print(f"  Avg Response Time: {avg_response_time}")
@@ -71,13 +544,7 @@ def process_participant_data(participant_id, participant_dir):
         print(f"  Accuracy: {accuracy}")
         
         # Update leaderboard
-        update_leaderboard(
-            participant_id,
-            avg_response_time,
-            avg_response_time_valid,
-            avg_response_time_invalid,
-            response_time_difference,
-            accuracy)
+        update_leaderboard(participant_id, *metrics)
         
     except Exception as e:
         print(f"Error processing data for {participant_id}: {e}")
@@ -91,60 +558,182 @@ def update_leaderboard(
         avg_response_time_invalid,
         response_time_difference,
         accuracy):
-    # Create leaderboard file if it doesn't exist
-    if not os.path.exists(LEADERBOARD_FILE):
-        with open(LEADERBOARD_FILE, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Participant', 'Response Time (s)', 'Response Time Valid Cues (s)', 
-                            'Response Time Invalid Cues (s)', 'Response Time Difference (s)', 'Accuracy'])
-    
-    # Read existing leaderboard
-    leaderboard = pd.read_csv(LEADERBOARD_FILE)
+    get_leaderboard().update(
+        participant_id,
+        avg_response_time,
+        avg_response_time_valid,
+        avg_response_time_invalid,
+        response_time_difference,
+        accuracy)
+
+def render_rows(leaderboard):
+    """Render the table rows of a leaderboard that is already sorted
+
+    The cells are formatted column by column and joined in one pass, the
+    data attributes used for sorting in the browser come from the same rows.
+    """
+    n = len(leaderboard)
+    values = {column: leaderboard[column].to_numpy(dtype=float) for column in LEADERBOARD_COLUMNS[1:]}
+    attributes = [values[column].astype(str).tolist() for column in LEADERBOARD_COLUMNS[1:]]
+    cells = [np.round(values[column], 3).astype(str).tolist() for column in LEADERBOARD_COLUMNS[1:-1]]
+    accuracy = np.char.add(np.round(values['Accuracy'] * 100, 1).astype(str), '%').tolist()
+    medals = (MEDALS + [''] * n)[:n]
+    participants = leaderboard['Participant'].astype(str).map(html.escape).tolist()
+    return ''.join([ROW_TEMPLATE.format(*fields) for fields in zip(
+        medals, range(1, n + 1), *attributes, participants, *cells, accuracy)])
+
+def render_leaderboard(leaderboard):
+    updated = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return HTML_HEAD + updated + HTML_HEADER + render_rows(leaderboard) + HTML_TAIL
+
+def update_leaderboard_display(path=HTML_FILE):
+    """Generate an HTML file to display the leaderboard"""
+    leaderboard = get_leaderboard().to_frame()
+    if leaderboard.empty:
+        return
+    # Viewers that reload while the file is written still see the old one
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_leaderboard(leaderboard))
+    os.replace(tmp_path, path)
+
+def load_metrics_cache():
+    if not os.path.exists(METRICS_CACHE_FILE):
+        return {}
+    try:
+        with open(METRICS_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable metrics cache: {e}")
+        return {}
+    if cache.get("version") != METRICS_CACHE_VERSION or cache.get("min_rt") != MIN_RT:
+        print("Ignoring metrics cache of another version")
+        return {}
+    return cache["entries"]
+
+def save_metrics_cache(cache):
+    tmp_path = METRICS_CACHE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": METRICS_CACHE_VERSION, "min_rt": MIN_RT, "entries": cache}, f)
+    os.replace(tmp_path, METRICS_CACHE_FILE)
+
+def check_existing_data(workers=None):
+    """Process existing data on startup
+
+    Participant files are parsed in parallel and the leaderboard is updated
+    in one batch. Metrics are cached by the path, modification time and size
+    of the file they were read from, so unchanged participants are skipped on
+    the next start.
+    """
+    if not os.path.exists(DATA_DIR):
+        return
+    cache = load_metrics_cache()
+    new_cache = {}
+    rows = []
+    jobs = {}
+    for participant_folder in os.listdir(DATA_DIR):
+        participant_dir = os.path.join(DATA_DIR, participant_folder)
+        if not os.path.isdir(participant_dir):
+            continue
+        file_path = finished_file(participant_folder, participant_dir)
+        if file_path is None:
+            # Sessions that are still running are not cached
+            jobs[participant_folder] = (participant_dir, None)
+            continue
+        stat = os.stat(file_path)
+        entry = cache.get(file_path)
+        if entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            rows.append((participant_folder, *entry["metrics"]))
+            new_cache[file_path] = entry
+        else:
+            jobs[participant_folder] = (participant_dir, {"path": file_path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+    print(f"Found {len(rows) + len(jobs)} participants, {len(rows)} unchanged since the last start")
     
-    # Check if participant already exists
-    if participant_id in leaderboard['Participant'].values:
-        # Update existing entry
-        idx = leaderboard.index[leaderboard['Participant'] == participant_id].tolist()[0]
-        leaderboard.at[idx, 'Response Time (s)'] = avg_response_time
-        leaderboard.at[idx, 'Response Time Valid Cues (s)'] = avg_response_time_valid
-        leaderboard.at[idx, 'Response Time Invalid Cues (s)'] = avg_response_time_invalid
-        leaderboard.at[idx, 'Response Time Difference (s)'] = response_time_difference
-        leaderboard.at[idx, 'Accuracy'] = accuracy
-    else:
-        # Add new entry
-        new_row = pd.DataFrame({
-            'Participant': [participant_id],
-            'Response Time (s)': [avg_response_time],
-            'Response Time Valid Cues (s)': [avg_response_time_valid],
-            'Response Time Invalid Cues (s)': [avg_response_time_invalid],
-            'Response Time Difference (s)': [response_time_difference],
-            'Accuracy': [accuracy]
-        })
-        leaderboard = pd.concat([leaderboard, new_row], ignore_index=True)
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                participant_id: executor.submit(compute_participant_metrics, participant_id, participant_dir)
+                for participant_id, (participant_dir, _) in jobs.items()
+            }
+            for participant_id, future in futures.items():
+                participant_dir, entry = jobs[participant_id]
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    print(f"Error processing data for {participant_id}: {e}")
+                    continue
+                if metrics is None:
+                    continue
+                rows.append((participant_id, *metrics))
+                if entry is not None:
+                    entry["metrics"] = [float(m) for m in metrics]
+                    new_cache[entry.pop("path")] = entry
     
-    # Sort by response time (lower is better) - this is just the default sort
-    leaderboard = leaderboard.sort_values('Response Time (s)')
+    get_leaderboard().update_many(rows)
+    save_metrics_cache(new_cache)
     
-    # Save updated leaderboard
-    leaderboard.to_csv(LEADERBOARD_FILE, index=False)
+    # Update the display after processing all existing data
+    update_leaderboard_display()
 
-def update_leaderboard_display():
-    """Generate an HTML file to display the leaderboard"""
-    if not os.path.exists(LEADERBOARD_FILE):
+def watch_store(database):
+    """Keep the leaderboard up to date from a SQLite session database"""
+    store = SessionStore(database)
+    last_trial = 0
+    print(f"Monitoring database '{database}' for new trials...")
+    while True:
+        # Only participants with new trials are recomputed, by SQLite
+        rows = store.participant_metrics(after=last_trial)
+        if rows:
+            last_trial = max(row[-1] for row in rows)
+            get_leaderboard().update_many([row[:-1] for row in rows])
+            update_leaderboard_display()
+        time.sleep(POLL_INTERVAL)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show a leaderboard of all participants")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Read the trials from this SQLite database instead of the data folder")
+    parser.add_argument("--serve", action="store_true",
+                        help="Serve a live leaderboard that updates without reloading")
+    parser.add_argument("--host", type=str, default=SERVER_HOST,
+                        help=f"Address of the live leaderboard (defaults to {SERVER_HOST})")
+    parser.add_argument("--port", type=int, default=SERVER_PORT,
+                        help=f"Port of the live leaderboard (defaults to {SERVER_PORT})")
+    args = parser.parse_args()
+    if args.serve:
+        LeaderboardServer(get_leaderboard(), args.host, args.port).start()
+    if args.db is not None:
+        try:
+            watch_store(args.db)
+        except KeyboardInterrupt:
+            get_leaderboard().snapshot()
         return
     
-    leaderboard = pd.read_csv(LEADERBOARD_FILE)
+    # Create data directory if it doesn't exist
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
     
-    # Format the data for display
-    formatted_leaderboard = leaderboard.copy()
-    formatted_leaderboard['Response Time (s)'] = formatted_leaderboard['Response Time (s)'].round(3)
-    formatted_leaderboard['Response Time Valid Cues (s)'] = formatted_leaderboard['Response Time Valid Cues (s)'].round(3)
-    formatted_leaderboard['Response Time Invalid Cues (s)'] = formatted_leaderboard['Response Time Invalid Cues (s)'].round(3)
-    formatted_leaderboard['Response Time Difference (s)'] = formatted_leaderboard['Response Time Difference (s)'].round(3)
-    formatted_leaderboard['Accuracy'] = (formatted_leaderboard['Accuracy'] * 100).round(1).astype(str) + '%'
+    # Process existing data first
+    check_existing_data()
     
-    # Create HTML with interactive sorting
-    html = """
+    # Set up file system observer
+    event_handler = ExperimentHandler()
+    observer = Observer()
+    observer.schedule(event_handler, DATA_DIR, recursive=True)  # Changed back to recursive=True
+    observer.start()
+    
+    print(f"Monitoring directory '{DATA_DIR}' for new CSV files...")
+    
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        observer.stop()
+    observer.join()
+    event_handler.stop()
+    get_leaderboard().snapshot()
+
+HTML_HEAD = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -169,7 +758,8 @@ def update_leaderboard_display():
     </head>
     <body>
         <h1>Experiment Leaderboard</h1>
-        <p>Last updated: """ + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + """</p>
+        <p>Last updated: """
+HTML_HEADER = """</p>
         <p>Click on any column header to sort the table by that column. Click again to reverse the sort order.</p>
         <table id="leaderboardTable">
             <thead>
@@ -184,40 +774,25 @@ def update_leaderboard_display():
                 </tr>
             </thead>
             <tbody>
-    """
-    
-    # Default sort by response time
-    formatted_leaderboard = formatted_leaderboard.sort_values('Response Time (s)')
-    
-    for i, (_, row) in enumerate(formatted_leaderboard.iterrows()):
-        rank_class = ""
-        if i == 0:
-            rank_class = "gold"
-        elif i == 1:
-            rank_class = "silver"
-        elif i == 2:
-            rank_class = "bronze"
-            
-        # Store original numeric values as data attributes for proper sorting
-        html += f"""
-            <tr class="{rank_class}" 
-                data-rank="{i+1}"
-                data-response-time="{leaderboard.iloc[i]['Response Time (s)']}"
-                data-valid-cues="{leaderboard.iloc[i]['Response Time Valid Cues (s)']}"
-                data-invalid-cues="{leaderboard.iloc[i]['Response Time Invalid Cues (s)']}"
-                data-difference="{leaderboard.iloc[i]['Response Time Difference (s)']}"
-                data-accuracy="{leaderboard.iloc[i]['Accuracy']}">
-                <td>{i+1}</td>
-                <td>{row['Participant']}</td>
-                <td>{row['Response Time (s)']}</td>
-                <td>{row['Response Time Valid Cues (s)']}</td>
-                <td>{row['Response Time Invalid Cues (s)']}</td>
-                <td>{row['Response Time Difference (s)']}</td>
-                <td>{row['Accuracy']}</td>
+"""
+ROW_TEMPLATE = """
+            <tr class="{0}"
+                data-rank="{1}"
+                data-response-time="{2}"
+                data-valid-cues="{3}"
+                data-invalid-cues="{4}"
+                data-difference="{5}"
+                data-accuracy="{6}">
+                <td>{1}</td>
+                <td>{7}</td>
+                <td>{8}</td>
+                <td>{9}</td>
+                <td>{10}</td>
+                <td>{11}</td>
+                <td>{12}</td>
             </tr>
-        """
-    
-    html += """
+"""
+HTML_TAIL = """
             </tbody>
         </table>
 
@@ -304,45 +879,78 @@ def update_leaderboard_display():
         </script>
     </body>
     </html>
-    """
-    
-    with open("leaderboard.html", "w") as f:
-        f.write(html)
-
-def check_existing_data():
-    """Process existing data on startup"""
-    if os.path.exists(DATA_DIR):
-        for participant_folder in os.listdir(DATA_DIR):
-            participant_dir = os.path.join(DATA_DIR, participant_folder)
-            if os.path.isdir(participant_dir):
-                # Process the participant data
-                process_participant_data(participant_folder, participant_dir)
-        
-        # Update the display after processing all existing data
-        update_leaderboard_display()
+"""
 
-def main():
-    # Create data directory if it doesn't exist
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    
-    # Process existing data first
-    check_existing_data()
-    
-    # Set up file system observer
-    event_handler = ExperimentHandler()
-    observer = Observer()
-    observer.schedule(event_handler, DATA_DIR, recursive=True)  # Changed back to recursive=True
-    observer.start()
-    
-    print(f"Monitoring directory '{DATA_DIR}' for new CSV files...")
-    
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+LIVE_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Live Leaderboard</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        h1 { color: #333; text-align: center; }
+        table { width: 100%; border-collapse: collapse; margin-top: 20px; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #4CAF50; color: white; }
+        tr:nth-child(even) { background-color: #f2f2f2; }
+        .gold { background-color: gold !important; }
+        .silver { background-color: silver !important; }
+        .bronze { background-color: #cd7f32 !important; }
+    </style>
+</head>
+<body>
+    <h1>Experiment Leaderboard</h1>
+    <table>
+        <thead>
+            <tr>
+                <th>Rank</th>
+                <th>Participant</th>
+                <th>Response Time (s)</th>
+                <th>Response Time Valid Cues (s)</th>
+                <th>Response Time Invalid Cues (s)</th>
+                <th>Response Time Difference (s)</th>
+                <th>Accuracy</th>
+            </tr>
+        </thead>
+        <tbody id="rows"></tbody>
+    </table>
+    <script>
+        const rows = new Map();
+        const tbody = document.getElementById('rows');
+        const medals = ['gold', 'silver', 'bronze'];
+        const seconds = (value) => value === null ? '' : value.toFixed(3);
+
+        const render = () => {
+            const ranked = Array.from(rows.values()).sort((a, b) => {
+                if (a.response_time === null) return 1;
+                if (b.response_time === null) return -1;
+                return a.response_time - b.response_time;
+            });
+            tbody.replaceChildren(...ranked.map((row, i) => {
+                const tr = document.createElement('tr');
+                if (i < 3) tr.className = medals[i];
+                const accuracy = row.accuracy === null ? '' : (row.accuracy * 100).toFixed(1) + '%';
+                [i + 1, row.participant, seconds(row.response_time), seconds(row.response_time_valid),
+                 seconds(row.response_time_invalid), seconds(row.response_time_difference), accuracy]
+                    .forEach((value) => {
+                        const td = document.createElement('td');
+                        td.textContent = value;
+                        tr.appendChild(td);
+                    });
+                return tr;
+            }));
+        };
+
+        const update = (changed) => {
+            changed.forEach((row) => rows.set(row.participant, row));
+            render();
+        };
+
+        // The first message of every connection is the full ranking
+        new EventSource('/events').onmessage = (event) => update(JSON.parse(event.data));
+    </script>
+</body>
+</html>
+"""
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,335 @@
+import argparse
+import sys
+from typing import List, Optional
+
+DESCRIPTION = (
+    "A Python implementation of the Posner attention cueing task built on PsychoPy"
+)
+EPILOG = """other commands:
+  posner validate CONFIG  check a configuration file without opening a window
+  posner simulate CONFIG  run headless sessions with a simulated observer
+  posner replay SESSION   run the trial sequence of a session again, headless
+  posner stats DATA_DIR   robust RT statistics of all finished sessions
+  posner timing TRACE     jitter summary of session timing traces
+  posner schema           JSON schema of the configuration file
+  posner orchestrate CONFIG  run several stations with one supervisor"""
+
+
+def main_cli(argv: Optional[List[str]] = None):
+    # PsychoPy and pygame are only imported by the commands that need them
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "validate":
+        return validate_cli(argv[1:])
+    if argv and argv[0] == "simulate":
+        return simulate_cli(argv[1:])
+    if argv and argv[0] == "replay":
+        return replay_cli(argv[1:])
+    if argv and argv[0] == "stats":
+        return stats_cli(argv[1:])
+    if argv and argv[0] == "timing":
+        return timing_cli(argv[1:])
+    if argv and argv[0] == "schema":
+        return schema_cli(argv[1:])
+    if argv and argv[0] == "orchestrate":
+        return orchestrate_cli(argv[1:])
+    return run_cli(argv)
+
+
+def run_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner",
+        description=DESCRIPTION,
+        epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "config",
+        type=str,
+        help="Path to the JSON file with the experiments configuration",
+    )
+    parser.add_argument(
+        "--screen",
+        type=int,
+        default=0,
+        help="Number of the screen where window is displayed (defaults to 0)",
+    )
+    parser.add_argument(
+        "--test", action="store_true", help="Run an automated test of the experiment"
+    )
+    args = parser.parse_args(argv)
+
+    from psychopy import visual
+    from posner.experiment import run_experiment, test_experiment
+
+    win = visual.Window(fullscr=True, screen=args.screen)
+    if args.test is False:
+        run_experiment(win, args.config)
+    else:
+        test_experiment(win, args.config)
+
+
+def validate_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner validate",
+        description="Check a configuration file without starting the experiment",
+    )
+    parser.add_argument(
+        "config",
+        type=str,
+        help="Path to the JSON file with the experiments configuration",
+    )
+    args = parser.parse_args(argv)
+
+    from pydantic import ValidationError
+    from posner.config import load_config
+
+    try:
+        load_config(args.config, acquire_devices=False)
+    except (FileNotFoundError, ValueError, ValidationError) as error:
+        print(f"{args.config} is not a valid configuration:\n{error}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{args.config} is a valid configuration")
+
+
+def schema_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner schema",
+        description="Export the JSON schema of the configuration file",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the schema to this file instead of printing it",
+    )
+    args = parser.parse_args(argv)
+
+    import json
+    from posner.config import config_schema
+
+    schema = json.dumps(config_schema(), indent=2) + "\n"
+    if args.output is None:
+        print(schema, end="")
+    else:
+        with open(args.output, "w") as f:
+            f.write(schema)
+
+
+def simulate_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner simulate",
+        description="Run headless sessions of the experiment with a simulated observer",
+    )
+    parser.add_argument(
+        "config",
+        type=str,
+        help="Path to the JSON file with the experiments configuration",
+    )
+    parser.add_argument(
+        "--sessions", type=int, default=1, help="Number of sessions (defaults to 1)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (defaults to the number of CPUs)",
+    )
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        default=None,
+        help="Write the data here instead of the root_dir in the configuration",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument(
+        "--cueing-effect",
+        type=float,
+        default=0.04,
+        help="How much slower invalidly cued targets are answered in s (defaults to 0.04)",
+    )
+    args = parser.parse_args(argv)
+
+    import time
+    from posner.simulation import run_simulations
+
+    tic = time.perf_counter()
+    subject_dirs = run_simulations(
+        args.config,
+        args.sessions,
+        root_dir=args.root_dir,
+        workers=args.workers,
+        seed=args.seed,
+        cueing_effect=args.cueing_effect,
+    )
+    elapsed = time.perf_counter() - tic
+    print(f"Simulated {len(subject_dirs)} sessions in {elapsed:.1f} s")
+
+
+def replay_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner replay",
+        description="Run the trial sequence of a recorded session again with a simulated observer",
+    )
+    parser.add_argument(
+        "subject_dir", type=str, help="Directory of the session to replay"
+    )
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        default=None,
+        help="Write the replay here (defaults to replays/ in the session's root directory)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the simulated observer (defaults to the session's seed)",
+    )
+    args = parser.parse_args(argv)
+
+    from pathlib import Path
+    import pandas as pd
+    from posner.data import load_sequence
+    from posner.simulation import replay_session
+
+    subject_dir = Path(args.subject_dir)
+    replay_dir = replay_session(subject_dir, args.root_dir, args.seed)
+    _, blocks = load_sequence(subject_dir / f"{subject_dir.name}_sequence.json")
+    expected = pd.concat(blocks, ignore_index=True)
+    replayed = pd.read_csv(replay_dir / f"{replay_dir.name}_data.csv")
+    print(f"Replayed {len(replayed)} trials of {subject_dir.name} to {replay_dir}")
+    if not replayed[["side", "valid"]].equals(expected[["side", "valid"]]):
+        print("The replayed trials differ from the recorded sequence", file=sys.stderr)
+        sys.exit(1)
+
+
+def stats_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner stats",
+        description="Compute robust RT statistics for every finished session",
+    )
+    parser.add_argument(
+        "data_dir", type=str, help="Directory with one folder per participant"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the statistics to this CSV file instead of printing them",
+    )
+    parser.add_argument(
+        "--min-rt",
+        type=float,
+        default=0.1,
+        help="Faster responses are anticipations and not used in s (defaults to 0.1)",
+    )
+    parser.add_argument(
+        "--trim",
+        type=float,
+        default=0.1,
+        help="Share of RTs cut from each end for the trimmed means (defaults to 0.1)",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        help="Number of resamples for the cueing effect CI (defaults to 0, no CI)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    from posner.stats import load_trials, participant_stats
+
+    stats = participant_stats(
+        load_trials(args.data_dir),
+        trim=args.trim,
+        min_rt=args.min_rt,
+        n_boot=args.bootstrap,
+        rng=np.random.default_rng(args.seed),
+    )
+    if args.output is None:
+        print(stats.to_string())
+    else:
+        stats.to_csv(args.output)
+
+
+def timing_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner timing",
+        description="Summarize the timing traces written with the trace option",
+    )
+    parser.add_argument(
+        "traces", type=str, nargs="+", help="Trace files (.json or .csv)"
+    )
+    args = parser.parse_args(argv)
+
+    from posner.trace import load_trace, summarize
+
+    summary = summarize(*[load_trace(path) for path in args.traces])
+    print(f"Timing of {len(args.traces)} session(s) in ms")
+    print(summary.round(3).to_string())
+
+
+def orchestrate_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="posner orchestrate",
+        description="Run one experiment station per screen, each in its own process",
+    )
+    parser.add_argument(
+        "config",
+        type=str,
+        help="Path to the JSON file with the experiments configuration",
+    )
+    parser.add_argument(
+        "--screens",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="Screen of every station (defaults to a single station on screen 0)",
+    )
+    parser.add_argument(
+        "--joysticks",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Joystick index of every station (defaults to 0, 1, 2, ...)",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=None,
+        help="Sessions per station before it stops (defaults to running until Ctrl+C)",
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=None,
+        help="How often a crashed station is restarted (defaults to always)",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Run headless stations with simulated observers, e.g. for load tests",
+    )
+    args = parser.parse_args(argv)
+    joysticks = args.joysticks
+    if joysticks is None:
+        joysticks = list(range(len(args.screens)))
+    if len(joysticks) != len(args.screens):
+        parser.error("give one joystick index per screen")
+
+    from posner.orchestrator import Station, Supervisor
+
+    stations = [
+        Station(f"station{i}", screen, joystick)
+        for i, (screen, joystick) in enumerate(zip(args.screens, joysticks))
+    ]
+    Supervisor(
+        args.config,
+        stations,
+        n_sessions=args.sessions,
+        simulate=args.simulate,
+        max_restarts=args.max_restarts,
+    ).run()
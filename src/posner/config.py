@@ -0,0 +1,153 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Literal, Tuple, Union, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic.json_schema import SkipJsonSchema
+
+# Validated configs by the SHA-256 of their file's contents
+_config_cache: Dict[str, "Config"] = {}
+
+
+class Pos(BaseModel):
+    left: Tuple[float, float]
+    right: Tuple[float, float]
+
+    @model_validator(mode="after")
+    def sides_are_correct(values):
+        assert values.left[0] < values.right[0]
+        return values
+
+
+class Staircase(BaseModel):
+    """Adapts `parameter` from trial to trial, see `posner.staircase`."""
+
+    parameter: Literal["cue_dur", "stim_opacity"]
+    # defaults to cue_dur, or a fully opaque target
+    start: Optional[float] = Field(default=None, ge=0, le=1)
+    step: float = Field(gt=0, le=1)
+    target: float = Field(default=0.8, gt=0, lt=1)
+    minimum: float = Field(default=0.0, ge=0, le=1)
+    maximum: float = Field(default=1.0, ge=0, le=1)
+
+    @model_validator(mode="after")
+    def range_is_not_empty(values):
+        assert values.minimum < values.maximum
+        return values
+
+    @model_validator(mode="after")
+    def start_is_in_range(values):
+        if values.start is not None:
+            assert values.minimum <= values.start <= values.maximum
+        return values
+
+
+class Config(BaseModel):
+    # frozen, because validated configs are cached and shared
+    model_config = {"arbitrary_types_allowed": True, "frozen": True}
+    root_dir: Path
+    input_method: Literal["Keyboard", "Controller"]
+    # set by open_devices, not part of the configuration file
+    controller: SkipJsonSchema[Optional[Any]] = Field(default=None, exclude=True)
+    joystick_index: int = Field(default=0, ge=0)
+    keyboard_backend: Literal["event", "hardware"] = "event"
+    # set by open_devices for the hardware keyboard back-end
+    keyboard: SkipJsonSchema[Optional[Any]] = Field(default=None, exclude=True)
+    max_wait: Union[int, float]
+    fix_dur: float = Field(ge=0, le=1)
+    cue_dur: float = Field(ge=0, le=1)
+    fix_radius: float
+    fix_color: str
+    stim_radius: float
+    stim_color: str
+    n_blocks: int
+    n_trials: int
+    p_valid: float = Field(ge=0, le=1)
+    pos: Pos
+    seed: Optional[int] = None
+    max_run_length: Optional[int] = Field(default=None, ge=1)
+    session_format: Optional[Literal["parquet"]] = None
+    storage: Literal["files", "sqlite"] = "files"
+    database: Optional[Path] = None
+    timing: Literal["wait", "frames"] = "wait"
+    refresh_rate: Optional[float] = Field(default=None, gt=0)
+    on_frame_drop: Literal["log", "raise"] = "log"
+    trace: Optional[Literal["json", "csv"]] = None
+    staircase: Optional[Staircase] = None
+
+    @field_validator("root_dir")
+    @staticmethod
+    def root_dir_exists(value: Path) -> Path:
+        assert value.exists()
+        return value
+
+    @model_validator(mode="after")
+    def conditions_can_be_divided_into_n_trials(values):
+        assert (values.n_trials / 2) * values.p_valid % 1 == 0
+        return values
+
+
+def load_config(config_file: str, acquire_devices: bool = True) -> Config:
+    """Load and validate a configuration file.
+
+    Validation is pure and its result is cached by the SHA-256 of the file,
+    so loading the same configuration again only reads and hashes the file.
+    With `acquire_devices`, the controller is opened afterwards.
+    """
+    path = Path(config_file)
+    if not path.is_file():
+        raise FileNotFoundError(f"Couldn't find config file at {config_file}")
+    content = path.read_bytes()
+    digest = hashlib.sha256(content).hexdigest()
+    config = _config_cache.get(digest)
+    if config is None:
+        config = Config.model_validate(json.loads(content))
+        _config_cache[digest] = config
+    if acquire_devices:
+        config = open_devices(config)
+    return config
+
+
+def open_devices(config: Config) -> Config:
+    """Return a copy of `config` with its input device opened.
+
+    Also fails if the session format can't be written, before a session is
+    run rather than at its end.
+    """
+    if config.session_format == "parquet":
+        from posner.data import import_pyarrow
+
+        import_pyarrow()
+    if config.input_method == "Keyboard":
+        if config.keyboard_backend == "event" or config.keyboard is not None:
+            return config
+        from posner.keyboard import get_listener, have_ptb
+
+        if not have_ptb():
+            raise ValueError(
+                "The hardware keyboard back-end needs psychtoolbox, "
+                "install it or use the event back-end"
+            )
+        return config.model_copy(update={"keyboard": get_listener()})
+    if config.controller is not None:
+        return config
+    import pygame
+
+    # initializing again is a no-op for pygame, but skip the calls anyway
+    if not pygame.get_init():
+        pygame.init()
+    if not pygame.joystick.get_init():
+        pygame.joystick.init()
+    if pygame.joystick.get_count() == 0:
+        raise ValueError("No joystick detected")
+    if config.joystick_index >= pygame.joystick.get_count():
+        raise ValueError(f"No joystick with index {config.joystick_index}")
+    joystick = pygame.joystick.Joystick(config.joystick_index)
+    joystick.init()
+    return config.model_copy(update={"controller": joystick})
+
+
+def config_schema() -> Dict[str, Any]:
+    """JSON schema of the configuration file, for validating it without posner."""
+    schema = Config.model_json_schema()
+    return {"$schema": "https://json-schema.org/draft/2020-12/schema", **schema}
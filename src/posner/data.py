@@ -0,0 +1,431 @@
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from posner.stats import MIN_RT
+
+PARTIAL_SUFFIX = ".part"
+TRIAL_COLUMNS = {
+    "side": object,
+    "valid": bool,
+    "response": object,
+    "response_time": float,
+    "fixation_onset": float,
+    "cue_onset": float,
+    "target_onset": float,
+    "staircase_value": float,
+}
+SIDES = ["left", "right"]
+# The primary key of the trials table also indexes the participant
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    participant TEXT PRIMARY KEY,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trials (
+    participant TEXT NOT NULL REFERENCES participants (participant),
+    trial INTEGER NOT NULL,
+    side TEXT NOT NULL,
+    valid INTEGER NOT NULL,
+    response TEXT,
+    response_time REAL,
+    fixation_onset REAL,
+    cue_onset REAL,
+    target_onset REAL,
+    staircase_value REAL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (participant, trial)
+);
+CREATE INDEX IF NOT EXISTS trials_timestamp ON trials (timestamp);
+"""
+_CLOSE = object()
+
+
+class TrialTable:
+    """Preallocated column arrays for the trials of one block.
+
+    Appending a trial only writes into the arrays, the DataFrame is built once
+    when the block is over.
+    """
+
+    def __init__(self, n_trials: int, columns: Optional[dict] = None):
+        if columns is None:
+            columns = TRIAL_COLUMNS
+        self.columns = {}
+        for name, dtype in columns.items():
+            values = np.empty(n_trials, dtype=dtype)
+            if values.dtype.kind == "f":
+                values.fill(np.nan)
+            self.columns[name] = values
+        self.n_rows = 0
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def append(self, record: dict) -> None:
+        i = self.n_rows
+        for name, values in self.columns.items():
+            value = record.get(name)
+            if value is None and values.dtype.kind == "f":
+                value = np.nan
+            values[i] = value
+        self.n_rows += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {name: values[: self.n_rows] for name, values in self.columns.items()}
+        )
+
+
+class BackgroundWriter:
+    """Hands trial rows to a background thread that stores them.
+
+    `write` only puts the row on a queue, so no disk access happens in the
+    trial loop. The thread flushes at least every `flush_interval` seconds,
+    so a crash only loses the most recent trials. Subclasses implement
+    `_open`, `_write`, `_flush` and `_finish`, which all run on the thread.
+    """
+
+    def __init__(self, flush_interval: float = 0.5):
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, row: dict) -> None:
+        self._queue.put(row)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            if self._error is None:
+                self._complete()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        dirty = False
+        last_flush = time.monotonic()
+        try:
+            self._open()
+            while True:
+                timeout = None
+                if dirty:
+                    timeout = max(0, last_flush + self.flush_interval - time.monotonic())
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    row = None
+                if row is _CLOSE:
+                    break
+                if row is not None:
+                    self._write(row)
+                    dirty = True
+                if dirty and time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush()
+                    dirty = False
+                    last_flush = time.monotonic()
+            self._flush()
+        except BaseException as error:
+            self._error = error
+        finally:
+            self._finish()
+
+    def _open(self) -> None:
+        pass
+
+    def _write(self, row: dict) -> None:
+        raise NotImplementedError
+
+    def _flush(self) -> None:
+        pass
+
+    def _finish(self) -> None:
+        pass
+
+    def _complete(self) -> None:
+        pass
+
+
+class TrialWriter(BackgroundWriter):
+    """Streams trial rows to a CSV file from a background thread.
+
+    Rows are appended to `<path>.part`, which `close` renames to `path` once
+    all rows are on disk.
+    """
+
+    def __init__(self, path: Union[str, Path], flush_interval: float = 0.5):
+        self.path = Path(path)
+        self.partial_path = partial_path(self.path)
+        self._file = open(self.partial_path, "w", newline="")
+        self._writer = None
+        super().__init__(flush_interval)
+
+    def _write(self, row: dict) -> None:
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(row))
+            self._writer.writeheader()
+        self._writer.writerow(row)
+
+    def _flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _finish(self) -> None:
+        self._file.close()
+
+    def _complete(self) -> None:
+        os.replace(self.partial_path, self.path)
+
+
+class SessionStore:
+    """All participants and trials in one SQLite database.
+
+    The database runs in WAL mode with a busy timeout, so several booths can
+    write to it while the leaderboard reads. Participant names are unique,
+    `add_participant` returns False for a name that is taken.
+    """
+
+    def __init__(self, path: Union[str, Path], timeout: float = 30.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.connection = connect_store(self.path, timeout)
+        self.connection.executescript(STORE_SCHEMA)
+        migrate_store(self.connection)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add_participant(self, participant: str) -> bool:
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO participants (participant, created) VALUES (?, ?)",
+                    (participant, time.time()),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def trial_writer(
+        self, participant: str, flush_interval: float = 0.5
+    ) -> "StoreTrialWriter":
+        return StoreTrialWriter(self.path, participant, flush_interval, self.timeout)
+
+    def trials(self, participant: str) -> pd.DataFrame:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(TRIAL_COLUMNS)} FROM trials "
+            "WHERE participant = ? ORDER BY trial",
+            self.connection,
+            params=(participant,),
+        )
+        df["valid"] = df["valid"].astype(bool)
+        return df
+
+    def participant_metrics(self, after: int = 0, min_rt: float = MIN_RT) -> List[tuple]:
+        """Mean RTs, cueing effect and accuracy per participant.
+
+        RTs are averaged over correct responses no faster than `min_rt`, as
+        in `posner.stats`. Only participants with trials inserted after the trial with rowid
+        `after` are returned. Rowids grow in commit order, so this also finds
+        trials that one booth committed late. Each row is (participant, mean
+        RT, mean RT valid, mean RT invalid, invalid - valid, accuracy, rowid
+        of the last trial).
+        """
+        return self.connection.execute(
+            """
+            SELECT participant,
+                AVG(rt),
+                AVG(CASE WHEN valid THEN rt END),
+                AVG(CASE WHEN NOT valid THEN rt END),
+                AVG(CASE WHEN NOT valid THEN rt END) - AVG(CASE WHEN valid THEN rt END),
+                AVG(correct),
+                MAX(rowid)
+            FROM (
+                SELECT participant, valid, rowid,
+                    COALESCE(response = side, 0) AS correct,
+                    CASE WHEN response = side AND response_time >= ?
+                        THEN response_time END AS rt
+                FROM trials
+                WHERE participant IN (SELECT participant FROM trials WHERE rowid > ?)
+            )
+            GROUP BY participant
+            """,
+            (min_rt, after),
+        ).fetchall()
+
+
+class StoreTrialWriter(BackgroundWriter):
+    """Streams the trial rows of one participant into a SessionStore."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        participant: str,
+        flush_interval: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.participant = participant
+        self.timeout = timeout
+        self._rows = []
+        self._n_trials = 0
+        super().__init__(flush_interval)
+
+    def write(self, row: dict) -> None:
+        super().write({**row, "timestamp": time.time()})
+
+    def _open(self) -> None:
+        self._connection = connect_store(self.path, self.timeout)
+
+    def _write(self, row: dict) -> None:
+        self._rows.append(
+            (self.participant, self._n_trials)
+            + tuple(row.get(name) for name in TRIAL_COLUMNS)
+            + (row["timestamp"],)
+        )
+        self._n_trials += 1
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT INTO trials (participant, trial, {', '.join(TRIAL_COLUMNS)}, "
+                f"timestamp) VALUES ({', '.join('?' * (len(TRIAL_COLUMNS) + 3))})",
+                self._rows,
+            )
+        self._rows = []
+
+    def _finish(self) -> None:
+        if hasattr(self, "_connection"):
+            self._connection.close()
+
+
+def connect_store(path: Union[str, Path], timeout: float = 30.0) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=timeout)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def migrate_store(connection: sqlite3.Connection) -> None:
+    """Add the trial columns that databases of older versions don't have."""
+    existing = {row[1] for row in connection.execute("PRAGMA table_info(trials)")}
+    with connection:
+        for name in TRIAL_COLUMNS:
+            if name not in existing:
+                connection.execute(f"ALTER TABLE trials ADD COLUMN {name} REAL")
+
+
+def partial_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + PARTIAL_SUFFIX)
+
+
+def read_partial_csv(path: Union[str, Path]) -> str:
+    """Return the complete lines of a CSV file that is still being written."""
+    with open(path, "r", newline="") as f:
+        text = f.read()
+    return text[: text.rfind("\n") + 1]
+
+
+def save_sequence(path: Union[str, Path], seed: int, blocks: List[pd.DataFrame]) -> None:
+    """Save the seed and trial sequence of a session so it can be replayed."""
+    sequence = {
+        "seed": int(seed),
+        "blocks": [
+            {"side": block["side"].tolist(), "valid": block["valid"].tolist()}
+            for block in blocks
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(sequence, f)
+
+
+def save_config(path: Union[str, Path], config) -> None:
+    """Save the configuration a session ran with, devices excluded."""
+    with open(path, "w") as f:
+        json.dump(config.model_dump(mode="json"), f, indent=4)
+
+
+def load_sequence(path: Union[str, Path]) -> Tuple[int, List[pd.DataFrame]]:
+    with open(path) as f:
+        sequence = json.load(f)
+    blocks = [pd.DataFrame(block) for block in sequence["blocks"]]
+    return sequence["seed"], blocks
+
+
+def import_pyarrow():
+    """Import pyarrow, which writing parquet sessions needs."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Writing parquet sessions requires pyarrow, install it with "
+            "`pip install posner[parquet]`"
+        )
+    return pyarrow
+
+
+def session_schema():
+    """Arrow schema of the trials in a session file."""
+    pa = import_pyarrow()
+    side = pa.dictionary(pa.int8(), pa.string())
+    return pa.schema(
+        [
+            ("side", side),
+            ("valid", pa.bool_()),
+            ("response", side),
+            ("response_time", pa.float64()),
+            ("fixation_onset", pa.float64()),
+            ("cue_onset", pa.float64()),
+            ("target_onset", pa.float64()),
+            ("staircase_value", pa.float64()),
+        ]
+    )
+
+
+def write_session(
+    path: Union[str, Path], df: pd.DataFrame, metadata: Dict[str, Any]
+) -> None:
+    """Write the trials of a session to a parquet file with a fixed schema.
+
+    Side and response are stored as categoricals and `valid` as a boolean,
+    so reading the file needs no type guessing. `metadata` is stored as JSON
+    in the file's schema metadata.
+    """
+    pa = import_pyarrow()
+    df = df.reindex(columns=list(TRIAL_COLUMNS))
+    for column in ["side", "response"]:
+        df[column] = pd.Categorical(df[column], categories=SIDES)
+    df["valid"] = df["valid"].astype(bool)
+    table = pa.Table.from_pandas(df, schema=session_schema(), preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**table.schema.metadata, b"posner": json.dumps(metadata).encode()}
+    )
+    pa.parquet.write_table(table, path)
+
+
+def read_session(path: Union[str, Path]) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Read a session file memory-mapped and return its trials and metadata."""
+    pa = import_pyarrow()
+    table = pa.parquet.read_table(path, memory_map=True)
+    metadata = json.loads(table.schema.metadata.get(b"posner", b"{}"))
+    return table.to_pandas(), metadata
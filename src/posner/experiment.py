@@ -1,143 +1,295 @@
-import argparse
+from __future__ import annotations
+
+import importlib
 import string
-import json
-import random
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from unittest.mock import patch
-from typing import Literal, Tuple, List, Union, Optional
-from pydantic import BaseModel, field_validator, model_validator
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Literal, Tuple, List, Union, Optional
 import pandas as pd
 import numpy as np
-from psychopy import visual, core, event
-import pygame
+from posner.cli import main_cli
+from posner.config import Config, Pos, load_config, open_devices
+from posner.data import (
+    BackgroundWriter,
+    SessionStore,
+    TrialTable,
+    TrialWriter,
+    save_config,
+    save_sequence,
+    write_session,
+)
+from posner.staircase import WeightedUpDown, make_staircase
+from posner.trace import Tracer
+
+if TYPE_CHECKING:
+    from psychopy import core, visual
 
 KEYMAP = {
     "Keyboard": {"left": "left", "right": "right", "exit": "escape"},
     "Controller": {"left": "A", "right": "Y", "exit": "X"},
 }
+# Button indices of the 8BitDo controller, any other button counts as "random"
+BUTTONMAP = {0: "right", 4: "left", 3: "exit"}
+
+
+@dataclass
+class Backend:
+    """What the experiment draws, times and reads input with.
+
+    `visual` creates the stimuli, `core` provides `Clock`, `wait` and
+    `getTime` (the clock of the flips) and `event` provides `waitKeys`, as
+    the PsychoPy modules of the same names do. `text_input` replaces
+    `get_text_input` for asking the participant's name.
+
+    PsychoPy is only imported for the modules that are not given, so a
+    backend of simulated modules runs without a display.
+    """
+
+    visual: Any = None
+    core: Any = None
+    event: Any = None
+    text_input: Optional[Callable[..., str]] = None
+
+    def __post_init__(self):
+        for name in ["visual", "core", "event"]:
+            if getattr(self, name) is None:
+                setattr(self, name, importlib.import_module(f"psychopy.{name}"))
+
+
+def test_experiment(win: visual.Window, config_file: str, seed: Optional[int] = None):
+    rng = np.random.default_rng(seed)
 
+    def mock_waitKeys(keyList=None, maxWait=None):
+        if keyList is None:
+            return ["space"]
+        return [keyList[rng.integers(len(keyList))]]
 
-class Pos(BaseModel):
-    left: Tuple[float, float]
-    right: Tuple[float, float]
-
-    @model_validator(mode="after")
-    def sides_are_correct(values):
-        assert values.left[0] < values.right[0]
-        return values
-
-
-class Config(BaseModel):
-    model_config = {"arbitrary_types_allowed": True}
-    root_dir: Path
-    input_method: Literal["Keyboard", "Controller"]
-    controller: Optional[pygame.joystick.JoystickType] = None
-    max_wait: Union[int, float]
-    fix_dur: Union[int, float]
-    cue_dur: Union[int, float]
-    fix_radius: float
-    fix_color: str
-    stim_radius: float
-    stim_color: str
-    n_blocks: int
-    n_trials: int
-    p_valid: float
-    pos: Pos
-
-    @field_validator("root_dir")
-    @staticmethod
-    def root_dir_exists(value: Path) -> Path:
-        assert value.exists()
-        return value
-
-    @field_validator("p_valid")
-    @staticmethod
-    def p_valid_is_percentage(value: float) -> float:
-        assert 0 <= value <= 1
-        return value
-
-    @field_validator("fix_dur", "cue_dur")
-    @staticmethod
-    def durations_are_positive(value: Union[int, float]) -> float:
-        assert 0 <= value <= 1
-        return float(value)
-
-    @model_validator(mode="after")
-    def conditions_can_be_divided_into_n_trials(values):
-        assert (values.n_trials / 2) * values.p_valid % 1 == 0
-        return values
-
-    @model_validator(mode="after")
-    def get_controller(values):
-        if values.input_method == "Controller":
-            pygame.init()
-            pygame.joystick.init()
-            joystick_count = pygame.joystick.get_count()
-            if joystick_count == 0:
-                raise ValueError("No joystick detected")
-            joystick = pygame.joystick.Joystick(0)
-            joystick.init()
-            values.controller = joystick
-        return values
-
-
-def test_experiment(subject_id: str, config: str, screen: int = 0):
-
-    def mock_waitKeys(keyList):
-        return [random.choice(keyList)]
-
-    with patch("posner.experiment.event.waitKeys", side_effect=mock_waitKeys):
-        run_experiment(subject_id, config, screen)
-
-
-def run_experiment(win: visual.Window, config_file: str, overwrite: bool = False):
-
-    config = load_config(config_file)
-    clock = core.Clock()
-
-    subject_id = get_text_input(win, "Enter you NAME and press any button to continue")
-    subject_dir = make_subject_dir(config, subject_id)
+    backend = Backend(event=SimpleNamespace(waitKeys=mock_waitKeys))
+    subject_id = f"test_{backend.core.getAbsTime()}"
+    backend.text_input = lambda *args, **kwargs: subject_id
+    run_experiment(win, config_file, backend=backend)
+
+
+def run_experiment(
+    win: visual.Window,
+    config_file: Union[str, Config],
+    overwrite: bool = False,
+    sequence: Optional[List[pd.DataFrame]] = None,
+    backend: Optional[Backend] = None,
+    heartbeat: Optional[Callable[[bool], None]] = None,
+) -> Path:
+    """Run a session and return the directory its data was written to.
+
+    The trial sequence is drawn from `config.seed`, or from a new seed that
+    is saved with the data, unless the blocks of a `sequence` are given.
+    `heartbeat` is called with True at the start of every block and after
+    every trial, and with False before every screen that waits for the
+    participant without a time limit.
+    """
+
+    backend = backend or Backend()
+    if isinstance(config_file, Config):
+        config = open_devices(config_file)
+    else:
+        config = load_config(config_file)
+    clock = backend.core.Clock()
+    tracer = Tracer(backend.core.getTime, enabled=config.trace is not None)
+    with tracer.span("build_stimuli", "setup"):
+        stimuli = Stimuli(win, config, backend)
+    scheduler = make_scheduler(win, config, backend)
+
+    store = open_store(config)
+
+    def text_input(*args, **kwargs):
+        if backend.text_input is not None:
+            return backend.text_input(win, *args, **kwargs)
+        return get_text_input(win, *args, backend=backend, **kwargs)
+
+    if heartbeat is not None:
+        heartbeat(False)
+    subject_id = text_input("Enter you NAME and press any button to continue")
+    subject_dir = make_subject_dir(config, subject_id, store)
     while subject_dir is None:
-        subject_id = get_text_input(
-            win, "The name already exists, pick a DIFFERENT one!", color="red"
+        subject_id = text_input(
+            "The name already exists, pick a DIFFERENT one!", color="red"
         )
-        subject_dir = make_subject_dir(config, subject_id)
+        subject_dir = make_subject_dir(config, subject_id, store)
+
+    seed = config.seed
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+        # with the seed filled in, the saved config reproduces the session
+        config = config.model_copy(update={"seed": int(seed)})
+    save_config(subject_dir / f"{subject_id}_config.json", config)
+    rng = np.random.default_rng(seed)
+    sequence_file = subject_dir / f"{subject_id}_sequence.json"
+    if sequence is None:
+        blocks = [make_trial_sequence(config, rng) for _ in range(config.n_blocks)]
+    else:
+        blocks = list(sequence)
+    save_sequence(sequence_file, seed, blocks)
 
-    display_instruction(win, config, clock)
+    staircase = make_staircase(config) if config.staircase is not None else None
 
-    end = False
-    df = []
-    while not end:
-        df.append(run_block(win, clock, config))
-        response = display_break_prompt(win, config, clock)
-        if response == "exit":
-            end = True
-    df = pd.concat(df)
-    df.to_csv(subject_dir / f"{subject_id}_data.csv", index=False)
+    if heartbeat is not None:
+        heartbeat(False)
+    display_instruction(win, config, clock, backend)
+
+    if store is not None:
+        writer = store.trial_writer(subject_id)
+        store.close()
+    else:
+        writer = TrialWriter(subject_dir / f"{subject_id}_data.csv")
+    with writer:
+        end = False
+        block = 0
+        data = []
+        while not end:
+            if len(blocks) == block:
+                # participant keeps going after n_blocks, extend the sequence
+                blocks.append(make_trial_sequence(config, rng))
+                save_sequence(sequence_file, seed, blocks)
+            data.append(
+                run_block(
+                    win,
+                    clock,
+                    config,
+                    stimuli,
+                    scheduler,
+                    writer,
+                    sequence=blocks[block],
+                    tracer=tracer,
+                    staircase=staircase,
+                    backend=backend,
+                    heartbeat=heartbeat,
+                )
+            )
+            block += 1
+            if heartbeat is not None:
+                heartbeat(False)
+            response = display_break_prompt(win, config, clock, backend)
+            if response == "exit":
+                end = True
+        if config.session_format is not None:
+            # written before the CSV is renamed, which is what the leaderboard waits for
+            metadata = {
+                "subject_id": subject_id,
+                "seed": int(seed),
+                "refresh_rate": getattr(scheduler, "refresh_rate", None),
+                "config": config.model_dump(mode="json", exclude={"controller"}),
+            }
+            write_session(
+                subject_dir / f"{subject_id}_data.{config.session_format}",
+                pd.concat(data, ignore_index=True),
+                metadata,
+            )
+    if config.trace is not None:
+        tracer.metadata.update(
+            subject_id=subject_id,
+            timing=config.timing,
+            refresh_rate=getattr(scheduler, "refresh_rate", None),
+        )
+        tracer.save(subject_dir / f"{subject_id}_trace.{config.trace}")
+    return subject_dir
 
 
 def run_block(
     win: visual.Window,
     clock: core.Clock,
     config: Config,
+    stimuli: Optional["Stimuli"] = None,
+    scheduler: Optional["WaitScheduler"] = None,
+    writer: Optional[BackgroundWriter] = None,
+    sequence: Optional[pd.DataFrame] = None,
+    tracer: Optional[Tracer] = None,
+    staircase: Optional[WeightedUpDown] = None,
+    backend: Optional[Backend] = None,
+    heartbeat: Optional[Callable[[bool], None]] = None,
 ) -> pd.DataFrame:
-
-    df = pd.DataFrame()
-    for i in range(config.n_trials):
-        side, valid = roll_condition(config.p_valid)
-        response, response_time = run_trial(win, clock, side, valid, config)
-        row = pd.DataFrame(
-            [
-                {
-                    "side": side,
-                    "valid": valid,
-                    "response": response,
-                    "response_time": response_time,
-                }
-            ]
-        )
-        df = pd.concat([df, row])
-    return df
+    """Run the trials of `sequence` and return their data.
+
+    With a `staircase`, the parameter of `config.staircase` is set to the
+    staircase's value before every trial and the value is stored with the
+    trial. `heartbeat` is called with True before the first trial and after
+    every trial.
+    """
+
+    backend = backend or Backend()
+    if stimuli is None:
+        stimuli = Stimuli(win, config, backend)
+    if scheduler is None:
+        scheduler = make_scheduler(win, config, backend)
+    if sequence is None:
+        sequence = make_trial_sequence(config, np.random.default_rng(config.seed))
+    if tracer is None:
+        tracer = Tracer(enabled=False)
+    if staircase is None and config.staircase is not None:
+        staircase = make_staircase(config)
+    parameter = config.staircase.parameter if staircase is not None else None
+    tracer.start_block()
+    if heartbeat is not None:
+        heartbeat(True)
+    table = TrialTable(len(sequence))
+    trials = list(zip(sequence["side"].tolist(), sequence["valid"].tolist()))
+    plan = None
+    for i, (side, valid) in enumerate(trials):
+        tracer.start_trial()
+        level = staircase.value if staircase is not None else None
+        if parameter == "stim_opacity":
+            stimuli.set_target_opacity(level)
+        prepared = {}
+        prepare_next = None
+        if i + 1 < len(trials):
+            prepare_next = partial(
+                _prepare_trial, trials[i + 1], stimuli, tracer, prepared
+            )
+
+        with tracer.span("trial", "trial"):
+            response, response_time = run_trial(
+                win,
+                clock,
+                side,
+                valid,
+                config,
+                stimuli,
+                scheduler,
+                tracer,
+                plan=plan,
+                predrawn=plan is not None,
+                prepare_next=prepare_next,
+                cue_dur=level if parameter == "cue_dur" else None,
+                backend=backend,
+            )
+            record = {
+                "side": side,
+                "valid": valid,
+                "response": response,
+                "response_time": response_time,
+                "fixation_onset": scheduler.timestamps["fixation"][0],
+                "cue_onset": scheduler.timestamps["cue"][0],
+                "target_onset": scheduler.timestamps["target"][0],
+                "staircase_value": level,
+            }
+            if staircase is not None:
+                # both possible next values are ready, this only picks one
+                staircase.update(response == side)
+            if writer is not None:
+                writer.write(record)
+            table.append(record)
+        if heartbeat is not None:
+            heartbeat(True)
+        plan = prepared.get("plan")
+    return table.to_frame()
+
+
+def _prepare_trial(trial, stimuli, tracer, prepared) -> None:
+    # runs while the target is on screen, the next fixation goes to the back
+    # buffer and is shown by the first flip of the next trial
+    with tracer.span("prepare_next", "setup"):
+        prepared["plan"] = plan_trial(*trial, stimuli)
+        prepared["plan"]["fixation"]()
 
 
 def run_trial(
@@ -146,38 +298,293 @@ def run_trial(
     side: Literal["left", "right"],
     valid: bool,
     config: Config,
+    stimuli: Optional["Stimuli"] = None,
+    scheduler: Optional["WaitScheduler"] = None,
+    tracer: Optional[Tracer] = None,
+    plan: Optional[Dict[str, Callable[[], None]]] = None,
+    predrawn: bool = False,
+    prepare_next: Optional[Callable[[], None]] = None,
+    cue_dur: Optional[float] = None,
+    backend: Optional[Backend] = None,
 ) -> Tuple[bool, float]:
+    """Show one trial and wait for the response.
+
+    `plan` are the draw functions of the phases from `plan_trial`. If the
+    fixation was already drawn into the back buffer, `predrawn` skips drawing
+    its first frame. `prepare_next` is called after the target flip, before
+    waiting for the response, to get the next trial ready. `cue_dur`
+    overrides the one of `config`.
+    """
+
+    backend = backend or Backend()
+    if stimuli is None:
+        stimuli = Stimuli(win, config, backend)
+    if scheduler is None:
+        scheduler = make_scheduler(win, config, backend)
+    if plan is None:
+        plan = plan_trial(side, valid, stimuli)
+    if cue_dur is None:
+        cue_dur = config.cue_dur
+
+    scheduler.start_trial()
+    scheduler.run_phase("fixation", plan["fixation"], config.fix_dur, predrawn)
+    scheduler.run_phase("cue", plan["cue"], cue_dur)
+    if config.input_method == "Controller" and config.controller is not None:
+        # dropped before the target, not when polling starts, so presses made
+        # while the next trial is prepared still count
+        _clear_controller_events()
+    scheduler.run_phase("target", plan["target"], 0)
+    if prepare_next is not None:
+        prepare_next()
+
+    onset = scheduler.timestamps["target"][0]
+    response, response_time, poll_start = _wait_for_response(
+        config,
+        clock,
+        keys=["left", "right"],
+        max_wait=config.max_wait,
+        onset=onset,
+        backend=backend,
+        clear=False,
+    )
+    if tracer is not None and tracer.enabled:
+        tracer.add_flips(scheduler.timestamps)
+        tracer.add("input_latency", "input", onset, poll_start - onset)
+        tracer.add(
+            "response",
+            "input",
+            poll_start,
+            onset + response_time - poll_start,
+            response=response,
+        )
+    return response, response_time
 
-    draw_frames(win, config)
-    draw_fixation(win, config)
-    win.flip()
-
-    core.wait(config.fix_dur)
 
-    draw_frames(win, config)
-    draw_fixation(win, config)
+def plan_trial(
+    side: Literal["left", "right"], valid: bool, stimuli: "Stimuli"
+) -> Dict[str, Callable[[], None]]:
+    """The draw function of every phase of a trial."""
     if (side == "left" and valid) or (side == "right" and not valid):
-        draw_frames(win, config, highlight="left")
+        cue_side = "left"
     else:
-        draw_frames(win, config, highlight="right")
-    win.flip()
-
-    core.wait(config.cue_dur)
-
-    draw_frames(win, config)
-    draw_stimulus(win, config, side)
-    win.flip()
-
-    response, response_time = wait_for_response(
-        config, clock, keys=["left", "right"], max_wait=config.max_wait
+        cue_side = "right"
+
+    def draw_fixation_phase():
+        stimuli.draw_frames()
+        stimuli.draw_fixation()
+
+    def draw_cue_phase():
+        stimuli.draw_fixation()
+        stimuli.draw_frames(highlight=cue_side)
+
+    def draw_target_phase():
+        stimuli.draw_frames()
+        stimuli.draw_stimulus(side)
+
+    return {
+        "fixation": draw_fixation_phase,
+        "cue": draw_cue_phase,
+        "target": draw_target_phase,
+    }
+
+
+class FrameDropError(RuntimeError):
+    pass
+
+
+class WaitScheduler:
+    """Shows each trial phase with a single flip and times it with `wait`."""
+
+    def __init__(self, win: visual.Window, wait: Optional[Callable[[float], None]] = None):
+        self.win = win
+        self.wait = wait or Backend().core.wait
+        self.timestamps = {}
+
+    def start_trial(self) -> None:
+        self.timestamps = {}
+
+    def run_phase(
+        self,
+        phase: str,
+        draw: Callable[[], None],
+        duration: float,
+        predrawn: bool = False,
+    ) -> None:
+        if not predrawn:
+            draw()
+        self.timestamps[phase] = [self.win.flip()]
+        if duration > 0:
+            self.wait(duration)
+
+
+class FrameScheduler(WaitScheduler):
+    """Shows each trial phase for a fixed number of frames.
+
+    Durations are converted to frame counts from the refresh rate and every
+    frame is drawn and flipped, so phase onsets are locked to the screen
+    refresh. Flip timestamps are kept per phase and intervals longer than one
+    frame are counted as dropped frames.
+    """
+
+    def __init__(
+        self,
+        win: visual.Window,
+        refresh_rate: Optional[float] = None,
+        on_frame_drop: Literal["log", "raise"] = "log",
+    ):
+        super().__init__(win)
+        if refresh_rate is None:
+            refresh_rate = win.getActualFrameRate()
+        if refresh_rate is None:
+            raise ValueError(
+                "Couldn't measure the refresh rate, set refresh_rate in the config"
+            )
+        self.refresh_rate = float(refresh_rate)
+        self.frame_dur = 1 / self.refresh_rate
+        self.on_frame_drop = on_frame_drop
+        self.dropped_frames = 0
+        self._last_flip = None
+
+    def start_trial(self) -> None:
+        super().start_trial()
+        self._last_flip = None
+
+    def n_frames(self, duration: float) -> int:
+        return max(1, round(duration * self.refresh_rate))
+
+    def run_phase(
+        self,
+        phase: str,
+        draw: Callable[[], None],
+        duration: float,
+        predrawn: bool = False,
+    ) -> None:
+        flips = []
+        for frame in range(self.n_frames(duration)):
+            if frame > 0 or not predrawn:
+                draw()
+            flips.append(self.win.flip())
+        self.timestamps[phase] = flips
+        self._check_frames(phase, flips)
+
+    def _check_frames(self, phase: str, flips: List[float]) -> None:
+        if self._last_flip is not None:
+            flips = [self._last_flip] + flips
+        self._last_flip = flips[-1]
+        frames = np.round(np.diff(flips) / self.frame_dur)
+        n_dropped = int(np.clip(frames - 1, 0, None).sum())
+        if n_dropped == 0:
+            return
+        self.dropped_frames += n_dropped
+        message = f"Dropped {n_dropped} frame(s) during the {phase} phase"
+        if self.on_frame_drop == "raise":
+            raise FrameDropError(message)
+        from psychopy import logging
+
+        logging.warning(message)
+
+
+def make_scheduler(
+    win: visual.Window, config: Config, backend: Optional[Backend] = None
+) -> WaitScheduler:
+    if config.timing == "frames":
+        return FrameScheduler(win, config.refresh_rate, config.on_frame_drop)
+    return WaitScheduler(win, (backend or Backend()).core.wait)
+
+
+def make_trial_sequence(
+    config: Config,
+    rng: Optional[np.random.Generator] = None,
+) -> pd.DataFrame:
+    """Draw the side and validity of every trial in a block.
+
+    Each side is the target equally often and exactly `p_valid` of the trials
+    on each side are validly cued. If `config.max_run_length` is set, the
+    sides are drawn one after the other, each with a probability proportional
+    to how many trials of that side are left, among the sides that keep the
+    rest of the block possible without longer runs.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    n_left = config.n_trials // 2
+    n_right = config.n_trials - n_left
+    n_valid_left = round(n_left * config.p_valid)
+    n_valid_right = round(n_right * config.p_valid)
+    side = np.repeat(
+        ["left", "left", "right", "right"],
+        [n_valid_left, n_left - n_valid_left, n_valid_right, n_right - n_valid_right],
     )
-    return response, response_time
-
-
-def roll_condition(p_valid: float) -> Tuple[Literal["left", "right"], bool]:
-    side = np.random.choice(["left", "right"])
-    valid = np.random.choice([True, False], p=[p_valid, 1 - p_valid])
-    return side, valid
+    valid = np.repeat(
+        [True, False, True, False],
+        [n_valid_left, n_left - n_valid_left, n_valid_right, n_right - n_valid_right],
+    )
+    if config.max_run_length is None:
+        order = rng.permutation(config.n_trials)
+        return pd.DataFrame({"side": side[order], "valid": valid[order]})
+    sides = draw_sides(n_left, n_right, config.max_run_length, rng)
+    valid_in_order = np.empty(config.n_trials, dtype=bool)
+    for name in ["left", "right"]:
+        # the validities of one side are shuffled onto its trials
+        valid_in_order[sides == name] = rng.permutation(valid[side == name])
+    return pd.DataFrame({"side": sides, "valid": valid_in_order})
+
+
+def draw_sides(
+    n_left: int, n_right: int, max_run_length: int, rng: np.random.Generator
+) -> np.ndarray:
+    """A random order of the sides without runs longer than `max_run_length`.
+
+    Raises a ValueError if no such order exists.
+    """
+    remaining = {"left": n_left, "right": n_right}
+    other = {"left": "right", "right": "left"}
+    if not can_finish_sides(n_left, n_right, 0, max_run_length):
+        raise ValueError(
+            f"{n_left} left and {n_right} right targets can't be ordered "
+            f"without runs longer than {max_run_length}"
+        )
+    sides = []
+    last, run = None, 0
+    for _ in range(n_left + n_right):
+        options = []
+        for name in ["left", "right"]:
+            next_run = run + 1 if name == last else 1
+            if remaining[name] == 0 or next_run > max_run_length:
+                continue
+            left_over = remaining[name] - 1
+            if can_finish_sides(left_over, remaining[other[name]], next_run, max_run_length):
+                options.append(name)
+        weights = np.array([remaining[name] for name in options], dtype=float)
+        name = options[rng.choice(len(options), p=weights / weights.sum())]
+        run = run + 1 if name == last else 1
+        last = name
+        remaining[name] -= 1
+        sides.append(name)
+    return np.array(sides)
+
+
+def can_finish_sides(n_same: int, n_other: int, run: int, max_run_length: int) -> bool:
+    """Whether `n_same` more targets on the side of the current run of `run`
+    and `n_other` on the other side can follow without longer runs."""
+
+    def n_runs(n):  # the fewest runs `n` targets fit into
+        return -(-n // max_run_length)
+
+    # starting with the other side, the runs of both sides alternate and the
+    # other side has as many runs as this one or one more
+    if max(n_runs(n_same), n_runs(n_other) - 1) <= min(n_same, n_other):
+        return True
+    if n_same == 0 or run >= max_run_length:
+        return False
+    # continuing the current run, it has `run` targets already
+    return max(n_runs(n_same + run), n_runs(n_other)) <= min(n_same, n_other + 1)
+
+
+def longest_run(values: np.ndarray) -> int:
+    if len(values) == 0:
+        return 0
+    changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return int(np.diff(np.concatenate([[0], changes, [len(values)]])).max())
 
 
 def wait_for_response(
@@ -185,62 +592,157 @@ def wait_for_response(
     clock: core.Clock,
     keys: Union[None, List[str]] = None,
     max_wait: Union[int, float] = np.inf,
+    onset: Optional[float] = None,
+    backend: Optional[Backend] = None,
 ) -> Tuple[Union[str, None], float]:
+    response, response_time, _ = _wait_for_response(
+        config, clock, keys, max_wait, onset, backend
+    )
+    return response, response_time
+
+
+def _wait_for_response(
+    config, clock, keys=None, max_wait=np.inf, onset=None, backend=None, clear=True
+):
+    # also returns when polling started, on the clock of the flips. Without
+    # `clear`, controller presses queued before the call count too
+    backend = backend or Backend()
     clock.reset()
+    # flips are timed by core.getTime, not by the clock's absolute time base
+    poll_start = backend.core.getTime()
+    # If the flip time of the stimulus is known, measure the RT from there
+    offset = 0.0 if onset is None else poll_start - onset
     response = None
+    if config.input_method == "Keyboard" and config.keyboard is not None:
+        # presses carry their own timestamps, measured from the onset
+        if onset is None:
+            onset = poll_start
+        return (*_get_response_listener(keys, max_wait, onset, config), poll_start)
     if config.input_method == "Keyboard":
-        response = _get_response_keyboard(keys, max_wait, config)
-    elif isinstance(config.controller, pygame.joystick.JoystickType):
-        response = _get_response_controller(keys, max_wait, clock, config)
+        response = _get_response_keyboard(keys, max_wait - offset, config, backend.event)
+        response_time = clock.getTime()
+    elif config.input_method == "Controller" and config.controller is not None:
+        if clear:
+            _clear_controller_events()
+        response, response_time = _get_response_controller(
+            keys, max_wait - offset, clock, config
+        )
     else:
         raise ValueError("No valid input method found!")
-    response_time = clock.getTime()
-    return response, response_time
+    return response, response_time + offset, poll_start
 
 
-def _get_response_controller(keys, max_wait, clock, config):
-    if keys is not None:
-        key_list = [KEYMAP[config.input_method][k] for k in keys]
-    else:
-        key_list = []
-    response = None
-    while response is None and clock.getTime().real < max_wait:
-        pygame.event.pump()
-        button_states = [
-            config.controller.get_button(i)
-            for i in range(config.controller.get_numbuttons())
-        ]
-        if button_states[0]:  # A button on 8BitDo
-            response = "right"
-        elif button_states[4]:
-            response = "left"  # Y button on 8BitDo
-        elif button_states[3]:
-            response = "exit"  # Y button on 8BitDo
-        elif any(button_states):
-            response = "random"
-        if response in key_list or (keys is None and response == "random"):
-            break
-    return response
+def _clear_controller_events() -> None:
+    import pygame
 
+    pygame.event.clear(pygame.JOYBUTTONDOWN)
 
-def _get_response_keyboard(keys, max_wait, config) -> str:
+
+def _get_response_controller(keys, max_wait, clock, config):
+    import pygame
+
+    instance_id = config.controller.get_instance_id()
+    while True:
+        remaining = max_wait - clock.getTime()
+        if remaining <= 0:
+            return None, clock.getTime()
+        # Block until the next event instead of polling, 0 means no timeout
+        timeout = 0 if np.isinf(remaining) else max(1, int(np.ceil(remaining * 1000)))
+        button_event = pygame.event.wait(timeout)
+        press_time = clock.getTime()
+        if button_event.type != pygame.JOYBUTTONDOWN:
+            continue
+        if button_event.instance_id != instance_id:
+            continue
+        response = BUTTONMAP.get(button_event.button, "random")
+        if keys is None or response in keys:
+            return response, press_time
+
+
+def _get_response_listener(keys, max_wait, onset, config):
+    key_map = KEYMAP[config.input_method]
+    reverse_map = {v: k for k, v in key_map.items()}
+    key_list = None if keys is None else [key_map[k] for k in keys]
+    pressed, response_time = config.keyboard.wait(key_list, onset, max_wait)
+    if pressed is None:
+        return None, response_time
+    return reverse_map.get(pressed, pressed), response_time
+
+
+def _get_response_keyboard(keys, max_wait, config, event) -> Optional[str]:
     reverse_map = {v: k for k, v in KEYMAP[config.input_method].items()}
     if keys is not None:
         key_list = [KEYMAP[config.input_method][k] for k in keys]
         pressed = event.waitKeys(keyList=key_list, maxWait=max_wait)
-        response = pressed[0]
-        return reverse_map.get(response, response)
     else:
         pressed = event.waitKeys(maxWait=max_wait)
-        response = pressed[0]
-        return reverse_map.get(response, response)
+    if pressed is None:  # timed out
+        return None
+    response = pressed[0]
+    return reverse_map.get(response, response)
+
+
+class Stimuli:
+    """Stimuli built once per window and config so trials only call draw().
+
+    Creating PsychoPy stimuli allocates new vertex buffers, which is too slow
+    and too variable to do in the frames leading up to target onset.
+    """
+
+    def __init__(self, win: visual.Window, config: Config, backend: Optional[Backend] = None):
+        visual = (backend or Backend()).visual
+        sides = {"left": config.pos.left, "right": config.pos.right}
+        self.frames = {
+            side: visual.Rect(win, lineColor="white", pos=pos)
+            for side, pos in sides.items()
+        }
+        self.highlighted_frames = {
+            side: visual.Rect(win, lineColor=config.stim_color, pos=pos)
+            for side, pos in sides.items()
+        }
+        self.fixation = visual.Circle(
+            win,
+            radius=config.fix_radius,
+            size=(1 / win.aspect, 1),
+            fillColor=config.fix_color,
+        )
+        self.targets = {
+            side: visual.Circle(
+                win,
+                pos=pos,
+                radius=config.stim_radius,
+                size=(1 / win.aspect, 1),
+                fillColor=config.stim_color,
+                lineColor=None,
+            )
+            for side, pos in sides.items()
+        }
+
+    def draw_frames(self, highlight: Optional[Literal["left", "right"]] = None) -> None:
+        for side in ["left", "right"]:
+            if side == highlight:
+                self.highlighted_frames[side].draw()
+            else:
+                self.frames[side].draw()
+
+    def draw_fixation(self) -> None:
+        self.fixation.draw()
+
+    def draw_stimulus(self, side: Literal["left", "right"]) -> None:
+        self.targets[side].draw()
+
+    def set_target_opacity(self, opacity: float) -> None:
+        for target in self.targets.values():
+            target.opacity = opacity
 
 
 def draw_frames(
     win: visual.Window,
     config: Config,
     highlight: Optional[Literal["left", "right"]] = None,
+    backend: Optional[Backend] = None,
 ) -> None:
+    visual = (backend or Backend()).visual
     for side, pos in zip(["left", "right"], [config.pos.left, config.pos.right]):
         if side == highlight:
             color = config.stim_color
@@ -250,7 +752,10 @@ def draw_frames(
         frame.draw()
 
 
-def draw_fixation(win: visual.Window, config: Config) -> None:
+def draw_fixation(
+    win: visual.Window, config: Config, backend: Optional[Backend] = None
+) -> None:
+    visual = (backend or Backend()).visual
     fixation = visual.Circle(
         win,
         radius=config.fix_radius,
@@ -261,8 +766,12 @@ def draw_fixation(win: visual.Window, config: Config) -> None:
 
 
 def draw_stimulus(
-    win: visual.Window, config: Config, side: Literal["left", "right"]
+    win: visual.Window,
+    config: Config,
+    side: Literal["left", "right"],
+    backend: Optional[Backend] = None,
 ) -> None:
+    visual = (backend or Backend()).visual
     if side == "left":
         pos = config.pos.left
     elif side == "right":
@@ -278,28 +787,31 @@ def draw_stimulus(
     stimulus.draw()
 
 
-def draw_text(win: visual.Window, text: str) -> None:
-    text_stim = visual.TextStim(win, text=text)
+def draw_text(win: visual.Window, text: str, backend: Optional[Backend] = None) -> None:
+    backend = backend or Backend()
+    text_stim = backend.visual.TextStim(win, text=text)
     text_stim.draw()
     win.flip()
-    core.wait(0.5)
+    backend.core.wait(0.5)
 
 
-def display_instruction(win, config, clock):
+def display_instruction(win, config, clock, backend=None):
     text = f"""Fixate the {config.fix_color.upper()} dot in the middle.
         One of the boxes will be highlighted {config.stim_color.upper()}.
         Then, a {config.stim_color.upper()} dot will appear. \n
         Say whether this dot is on the left or right side by pressing the {KEYMAP[config.input_method]["left"]} or {KEYMAP[config.input_method]["right"]} key.
         Respond as FAST as possible!\n
         Press any key to continue"""
-    draw_text(win, text)
-    wait_for_response(config, clock)
+    draw_text(win, text, backend)
+    wait_for_response(config, clock, backend=backend)
 
 
-def display_break_prompt(win, config, clock):
+def display_break_prompt(win, config, clock, backend=None):
     text = f" Press {KEYMAP[config.input_method]['exit']} if you want to exit. Press any other key to keep going"
-    draw_text(win, text)
-    response, _ = wait_for_response(config, clock, keys=["left", "right", "exit"])
+    draw_text(win, text, backend)
+    response, _ = wait_for_response(
+        config, clock, keys=["left", "right", "exit"], backend=backend
+    )
     return response
 
 
@@ -309,7 +821,10 @@ def get_text_input(
     footer_text: str = "",
     max_length: int = 20,
     color="white",
+    backend: Optional[Backend] = None,
 ) -> str:
+    backend = backend or Backend()
+    visual, event = backend.visual, backend.event
 
     header = visual.TextStim(win, text=header_text, pos=(0, 0.3), color=color)
     text_box = visual.Rect(win, width=0.7, height=0.3, pos=(0, 0), fillColor="darkgrey")
@@ -346,46 +861,31 @@ def get_text_input(
                         current_text += key
 
 
-def load_config(config_file: str) -> Config:
-    if not Path(config_file).exists():
-        raise FileNotFoundError(f"Couldn't find config file at {config_file}")
-    config_dict = json.load(open(config_file))
-    return Config(**config_dict)
-
-
-def make_subject_dir(config: Config, subject_id: str) -> Union[None, Path]:
+def make_subject_dir(
+    config: Config, subject_id: str, store: Optional[SessionStore] = None
+) -> Union[None, Path]:
     subject_dir = Path(config.root_dir) / "data" / subject_id
-    if subject_dir.exists():
-        return None
-    else:
-        subject_dir.mkdir(parents=True)
+    if store is not None:
+        # the database decides whether the name is taken
+        if not store.add_participant(subject_id):
+            return None
+        subject_dir.mkdir(parents=True, exist_ok=True)
         return subject_dir
+    try:
+        # fails if another station took the name first
+        subject_dir.mkdir(parents=True)
+    except FileExistsError:
+        return None
+    return subject_dir
 
 
-def main_cli():
-    parser = argparse.ArgumentParser(
-        description="A Python implementation of the Posner attention cueing task built on PsychoPy"
-    )
-    parser.add_argument(
-        "config",
-        type=str,
-        help="Path to the JSON file with the experiments configuration",
-    )
-    parser.add_argument(
-        "--screen",
-        type=int,
-        default=0,
-        help="Number of the screen where window is displayed (defaults to 0)",
-    )
-    parser.add_argument(
-        "--test", action="store_true", help="Run an automated test of the experiment"
-    )
-    args = parser.parse_args()
-    win = visual.Window(fullscr=True, screen=args.screen)
-    if args.test is False:
-        run_experiment(win, args.config)
-    else:
-        test_experiment(args.subject_id, args.config, args.overwrite, args.screen)
+def open_store(config: Config) -> Optional[SessionStore]:
+    if config.storage != "sqlite":
+        return None
+    database = config.database
+    if database is None:
+        database = Path(config.root_dir) / "posner.db"
+    return SessionStore(database)
 
 
 if __name__ == "__main__":
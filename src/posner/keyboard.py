@@ -0,0 +1,108 @@
+"""Key presses timestamped when they happen instead of when they are read.
+
+`event.waitKeys` only returns after the key press reached the main thread,
+so an RT taken from a clock at that point includes the delay until then.
+`KeyboardListener` collects presses from `psychopy.hardware.keyboard` on its
+own thread. The Psychtoolbox back-end is required: every press carries the
+time stamp of the keyboard event itself, which is converted to the clock of
+the screen flips (`core.getTime`).
+"""
+
+import queue
+import threading
+from typing import Callable, List, Optional, Tuple
+
+POLL_INTERVAL = 0.001
+
+_listener = None
+
+
+class KeyboardListener:
+    """Reads key presses on a background thread.
+
+    Every press is queued with its time on `time_fn`, the clock the flips
+    are timed with, so waiting for a response doesn't block drawing and the
+    RT doesn't depend on when the main thread gets to it. `origin` is where
+    `time_fn` is zero on PsychoPy's absolute time base.
+    """
+
+    def __init__(
+        self,
+        keyboard=None,
+        time_fn: Optional[Callable[[], float]] = None,
+        origin: Optional[float] = None,
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        if keyboard is None:
+            from psychopy.hardware.keyboard import Keyboard
+
+            # PsychoPy's fallback, the event back-end, has no time stamps and
+            # would take the presses event.waitKeys waits for on other screens
+            keyboard = Keyboard(backend="ptb")
+        if time_fn is None:
+            from psychopy import core
+
+            time_fn = core.getTime
+            origin = core.monotonicClock.getLastResetTime()
+        self.keyboard = keyboard
+        self.time_fn = time_fn
+        self.origin = 0.0 if origin is None else origin
+        self.poll_interval = poll_interval
+        self.presses = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            for key in self.keyboard.getKeys(waitRelease=False, clear=True):
+                # key.rt is measured from the last reset of the keyboard's
+                # clock, which is on the absolute time base
+                reset_time = self.keyboard.clock.getLastResetTime() - self.origin
+                press_time = reset_time + key.rt
+                self.presses.put((key.name, press_time))
+            self._stopped.wait(self.poll_interval)
+
+    def wait(
+        self, keys: Optional[List[str]], onset: float, max_wait: float
+    ) -> Tuple[Optional[str], float]:
+        """Wait for one of `keys` pressed after `onset`.
+
+        Returns the key and its time from `onset`, or None and the time
+        waited if nothing was pressed within `max_wait` seconds of `onset`.
+        """
+        deadline = onset + max_wait
+        while True:
+            remaining = deadline - self.time_fn()
+            if remaining <= 0:
+                return None, self.time_fn() - onset
+            try:
+                name, press_time = self.presses.get(timeout=min(remaining, 3600))
+            except queue.Empty:
+                continue
+            if press_time < onset:
+                # pressed before the target appeared
+                continue
+            if press_time > deadline:
+                return None, max_wait
+            if keys is None or name in keys:
+                return name, press_time - onset
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def have_ptb() -> bool:
+    """Whether PsychoPy can read the keyboard with Psychtoolbox."""
+    from psychopy.hardware import keyboard
+
+    return keyboard.havePTB
+
+
+def get_listener() -> KeyboardListener:
+    """The listener of this process, started on first use."""
+    global _listener
+    if _listener is None:
+        _listener = KeyboardListener()
+    return _listener
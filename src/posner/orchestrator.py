@@ -0,0 +1,244 @@
+"""Run several experiment stations from one supervisor.
+
+Every station is a separate process with its own window, controller and log
+file, so a crash or a hanging driver in one booth can't affect the others.
+Stations run one session after the other and report to the supervisor over
+a queue. A station sends a heartbeat with every trial, so one whose session
+stops making progress is noticed. The supervisor restarts stations that crash
+or hang and regularly prints their health and throughput.
+"""
+
+import multiprocessing
+import queue
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+from posner.config import load_config, open_devices
+
+# longer than any trial takes, including its maximum wait for the response
+HEARTBEAT_TIMEOUT = 15.0
+REPORT_INTERVAL = 30.0
+RESTART_DELAY = 2.0
+# how long a terminated station may take to exit before it is killed
+TERMINATE_TIMEOUT = 5.0
+
+
+@dataclass
+class Station:
+    name: str
+    screen: int = 0
+    joystick_index: int = 0
+
+
+@dataclass
+class StationStatus:
+    station: Station
+    process: Optional[multiprocessing.Process] = None
+    state: str = "starting"
+    sessions: int = 0
+    restarts: int = 0
+    started: float = field(default_factory=time.monotonic)
+    last_seen: Optional[float] = None
+    # whether the station is in a block, only then heartbeats are expected
+    busy: bool = False
+    restart_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+def run_station(
+    station: Station,
+    config_file: Union[str, Path],
+    health,
+    n_sessions: Optional[int] = None,
+    simulate: bool = False,
+) -> None:
+    """Run sessions on one station until `n_sessions` are done.
+
+    Runs in the station's process. Its output goes to `logs/<station>.log`
+    in the root directory and its health is reported on the `health` queue:
+    a heartbeat from the session loop with every trial, and every finished
+    session.
+    """
+    config = load_config(config_file, acquire_devices=False)
+    config = config.model_copy(update={"joystick_index": station.joystick_index})
+    log_dir = Path(config.root_dir) / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    sys.stdout = sys.stderr = open(log_dir / f"{station.name}.log", "a", buffering=1)
+    print(f"Station {station.name} started on screen {station.screen}")
+
+    def heartbeat(busy):
+        health.put(("heartbeat", station.name, busy))
+
+    if simulate:
+        from posner.simulation import simulate_session
+
+        def run_session():
+            return simulate_session(config, station.name, heartbeat=heartbeat)
+
+    else:
+        from psychopy import visual
+        from posner.experiment import run_experiment
+
+        config = open_devices(config)
+        win = visual.Window(fullscr=True, screen=station.screen)
+
+        def run_session():
+            return run_experiment(win, config, heartbeat=heartbeat)
+
+    session = 0
+    while n_sessions is None or session < n_sessions:
+        subject_dir = run_session()
+        print(f"Finished session {subject_dir}")
+        health.put(("session", station.name, str(subject_dir)))
+        session += 1
+
+
+class Supervisor:
+    """Starts one process per station, restarts them and reports their health.
+
+    A station that exits with an error is restarted after `restart_delay`
+    seconds, at most `max_restarts` times. A station that sent no heartbeat
+    for `heartbeat_timeout` seconds during a block is unresponsive: it is
+    terminated and restarted like a crashed one. Waiting for the participant
+    between blocks has no time limit. `target` is the function each station
+    process runs.
+    """
+
+    def __init__(
+        self,
+        config_file: Union[str, Path],
+        stations: List[Station],
+        n_sessions: Optional[int] = None,
+        simulate: bool = False,
+        restart_delay: float = RESTART_DELAY,
+        max_restarts: Optional[int] = None,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+        target: Callable = run_station,
+    ):
+        self.config_file = str(config_file)
+        self.n_sessions = n_sessions
+        self.simulate = simulate
+        self.restart_delay = restart_delay
+        self.max_restarts = max_restarts
+        self.heartbeat_timeout = heartbeat_timeout
+        self.target = target
+        # every station gets a fresh interpreter, nothing is shared with the supervisor
+        self._context = multiprocessing.get_context("spawn")
+        self.health = self._context.Queue()
+        self.stations = {station.name: StationStatus(station) for station in stations}
+
+    def start(self) -> None:
+        for status in self.stations.values():
+            self._start(status)
+
+    def _start(self, status: StationStatus) -> None:
+        process = self._context.Process(
+            target=self.target,
+            args=(status.station, self.config_file, self.health, self.n_sessions, self.simulate),
+            name=f"posner-{status.station.name}",
+            daemon=True,
+        )
+        process.start()
+        status.process = process
+        status.state = "running"
+        status.last_seen = time.monotonic()
+        status.busy = False
+        status.restart_at = None
+
+    def poll(self) -> None:
+        """Read the health reports and restart the stations that crashed."""
+        self._read_health()
+        now = time.monotonic()
+        for status in self.stations.values():
+            if status.state == "waiting":
+                if now >= status.restart_at:
+                    status.restarts += 1
+                    self._start(status)
+            elif status.state == "running":
+                self._check(status, now)
+
+    def _read_health(self) -> None:
+        while True:
+            try:
+                kind, name, payload = self.health.get_nowait()
+            except queue.Empty:
+                break
+            status = self.stations[name]
+            status.last_seen = time.monotonic()
+            if kind == "heartbeat":
+                status.busy = payload
+            elif kind == "session":
+                status.sessions += 1
+
+    def _check(self, status: StationStatus, now: float) -> None:
+        exitcode = status.process.exitcode
+        if exitcode == 0:
+            status.state = "finished"
+        elif exitcode is not None:
+            status.error = f"exit code {exitcode}"
+            print(f"Station {status.station.name} crashed with {status.error}", flush=True)
+            self._restart_later(status, now)
+        elif status.busy and now - status.last_seen > self.heartbeat_timeout:
+            status.error = f"no heartbeat for {now - status.last_seen:.0f} s"
+            print(f"Station {status.station.name} is unresponsive, {status.error}", flush=True)
+            self._terminate(status.process)
+            self._restart_later(status, now)
+
+    def _restart_later(self, status: StationStatus, now: float) -> None:
+        if self.max_restarts is not None and status.restarts >= self.max_restarts:
+            status.state = "failed"
+        else:
+            status.state = "waiting"
+            status.restart_at = now + self.restart_delay
+
+    @staticmethod
+    def _terminate(process: multiprocessing.Process) -> None:
+        process.terminate()
+        process.join(TERMINATE_TIMEOUT)
+        if process.is_alive():
+            # a process stuck in a driver call may not react to terminate
+            process.kill()
+            process.join()
+
+    def done(self) -> bool:
+        return all(status.state in ("finished", "failed") for status in self.stations.values())
+
+    def report(self) -> str:
+        now = time.monotonic()
+        lines = [f"{'station':<12}{'state':<14}{'pid':>8}{'sessions':>10}{'per hour':>10}{'restarts':>10}"]
+        for name, status in self.stations.items():
+            hours = max(now - status.started, 1e-9) / 3600
+            pid = status.process.pid if status.process is not None else ""
+            lines.append(
+                f"{name:<12}{status.state:<14}{pid:>8}{status.sessions:>10}"
+                f"{status.sessions / hours:>10.1f}{status.restarts:>10}"
+            )
+        return "\n".join(lines)
+
+    def stop(self) -> None:
+        for status in self.stations.values():
+            if status.process is not None and status.process.is_alive():
+                status.process.terminate()
+        for status in self.stations.values():
+            if status.process is not None:
+                status.process.join()
+
+    def run(self, poll_interval: float = 0.5, report_interval: float = REPORT_INTERVAL) -> None:
+        """Supervise the stations until all are finished or Ctrl+C is pressed."""
+        self.start()
+        last_report = time.monotonic()
+        try:
+            while not self.done():
+                time.sleep(poll_interval)
+                self.poll()
+                if time.monotonic() - last_report >= report_interval:
+                    print(self.report(), flush=True)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self._read_health()
+            print(self.report(), flush=True)
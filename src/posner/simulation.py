@@ -0,0 +1,283 @@
+"""Headless simulation of whole experiment sessions.
+
+`run_experiment` is given a `Backend` of simulated PsychoPy `visual`, `core`
+and `event` modules: stimuli are no-ops, a virtual clock skips every wait and
+a simulated observer answers the key presses. This runs full
+`run_experiment` sessions, including writing the data, in milliseconds.
+"""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Union
+import numpy as np
+import pandas as pd
+from posner.config import Config
+
+REFRESH_RATE = 60.0
+
+
+class VirtualTime:
+    """Time that only moves forward when something waits."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def getTime(self) -> float:
+        return self.now
+
+    def wait(self, secs: float, hogCPUperiod: float = 0) -> None:
+        self.now += max(0.0, secs)
+
+
+class VirtualClock:
+    def __init__(self, time: VirtualTime):
+        self._time = time
+        self._time_at_last_reset = time.now
+
+    def reset(self, newT: float = 0.0) -> None:
+        self._time_at_last_reset = self._time.now + newT
+
+    def getTime(self) -> float:
+        return self._time.now - self._time_at_last_reset
+
+    def getLastResetTime(self) -> float:
+        return self._time_at_last_reset
+
+
+class SimulatedStim:
+    def __init__(self, win: "SimulatedWindow", **kwargs):
+        self.win = win
+        self.pos = kwargs.get("pos")
+        self.lineColor = kwargs.get("lineColor")
+        self.text = kwargs.get("text")
+
+    def draw(self) -> None:
+        self.win.drawn.append(self)
+
+    def setText(self, text: str) -> None:
+        self.text = text
+
+
+class SimulatedRect(SimulatedStim):
+    pass
+
+
+class SimulatedCircle(SimulatedStim):
+    pass
+
+
+class SimulatedWindow:
+    """Window that keeps track of what is on the screen instead of drawing it.
+
+    Every flip advances the virtual time to the next frame. The cue is the
+    last frame drawn in a color other than white before the target, the
+    target is the circle drawn at one of the sides.
+    """
+
+    def __init__(self, time: VirtualTime, refresh_rate: float = REFRESH_RATE, **kwargs):
+        self.time = time
+        self.refresh_rate = refresh_rate
+        self.aspect = 16 / 9
+        self.drawn = []
+        self.cue = None
+        self.target = None
+
+    def flip(self, clearBuffer: bool = True) -> float:
+        frame_dur = 1 / self.refresh_rate
+        self.time.now = (np.floor(self.time.now / frame_dur + 1e-9) + 1) * frame_dur
+        cue = None
+        target = None
+        for stim in self.drawn:
+            if stim.pos is None or stim.pos[0] == 0:
+                continue
+            side = "left" if stim.pos[0] < 0 else "right"
+            if isinstance(stim, SimulatedRect) and stim.lineColor != "white":
+                cue = side
+            elif isinstance(stim, SimulatedCircle):
+                target = side
+        # the target follows the cue, which is remembered until then
+        if target is None:
+            self.cue = cue
+        self.target = target
+        self.drawn = []
+        return self.time.now
+
+    def getActualFrameRate(self, **kwargs) -> float:
+        return self.refresh_rate
+
+
+class SimulatedObserver:
+    """Answers the key presses of a session like a participant would.
+
+    RTs are drawn from an ex-Gaussian distribution (`mu`, `sigma`, `tau`) and
+    invalidly cued targets are answered `cueing_effect` seconds slower. With
+    probability `p_error` the wrong side is pressed. The session ends after
+    `n_blocks` blocks.
+    """
+
+    def __init__(
+        self,
+        win: SimulatedWindow,
+        n_blocks: int,
+        rng: Optional[np.random.Generator] = None,
+        mu: float = 0.35,
+        sigma: float = 0.05,
+        tau: float = 0.1,
+        cueing_effect: float = 0.04,
+        p_error: float = 0.03,
+        key_delay: float = 1.0,
+    ):
+        self.win = win
+        self.n_blocks = n_blocks
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.mu = mu
+        self.sigma = sigma
+        self.tau = tau
+        self.cueing_effect = cueing_effect
+        self.p_error = p_error
+        self.key_delay = key_delay
+        self.n_breaks = 0
+
+    def waitKeys(self, maxWait: float = float("inf"), keyList=None, **kwargs):
+        if keyList is None:  # instructions, any key continues
+            self.win.time.wait(self.key_delay)
+            return ["space"]
+        if "escape" in keyList:  # break prompt
+            self.win.time.wait(self.key_delay)
+            self.n_breaks += 1
+            return ["escape" if self.n_breaks >= self.n_blocks else keyList[0]]
+        return self.respond(maxWait, keyList)
+
+    def respond(self, max_wait: float, key_list: List[str]) -> Optional[List[str]]:
+        rt = self.rng.normal(self.mu, self.sigma) + self.rng.exponential(self.tau)
+        if self.win.cue is not None and self.win.cue != self.win.target:
+            rt += self.cueing_effect
+        rt = max(rt, 0.0)
+        if rt > max_wait:
+            self.win.time.wait(max_wait)
+            return None
+        self.win.time.wait(rt)
+        response = self.win.target
+        if self.rng.random() < self.p_error:
+            response = "left" if response == "right" else "right"
+        if response not in key_list:
+            response = key_list[0]
+        return [response]
+
+
+def simulate_session(
+    config: Config,
+    subject_id: str,
+    seed: Optional[int] = None,
+    sequence: Optional[List[pd.DataFrame]] = None,
+    heartbeat: Optional[Callable[[bool], None]] = None,
+    **observer_kwargs,
+) -> Path:
+    """Run one session of the experiment with a simulated observer.
+
+    The session runs the blocks of `sequence` if given and reports its
+    progress to `heartbeat` like `run_experiment`. Returns the directory the
+    session's data was written to.
+    """
+    from posner import experiment
+
+    update = {"input_method": "Keyboard", "keyboard_backend": "event", "keyboard": None}
+    if config.seed is None and seed is not None:
+        update["seed"] = seed
+    config = config.model_copy(update=update)
+    time = VirtualTime()
+    win = SimulatedWindow(time, refresh_rate=config.refresh_rate or REFRESH_RATE)
+    observer = SimulatedObserver(
+        win, config.n_blocks, np.random.default_rng(seed), **observer_kwargs
+    )
+    # a taken name is answered by appending a number
+    names = (subject_id if i == 0 else f"{subject_id}_{i}" for i in count())
+    backend = experiment.Backend(
+        visual=SimpleNamespace(
+            Window=SimulatedWindow,
+            Rect=SimulatedRect,
+            Circle=SimulatedCircle,
+            TextStim=SimulatedStim,
+        ),
+        core=SimpleNamespace(
+            Clock=lambda: VirtualClock(time),
+            wait=time.wait,
+            getTime=time.getTime,
+        ),
+        event=SimpleNamespace(waitKeys=observer.waitKeys),
+        text_input=lambda *args, **kwargs: next(names),
+    )
+    return experiment.run_experiment(
+        win, config, sequence=sequence, backend=backend, heartbeat=heartbeat
+    )
+
+
+def replay_session(
+    subject_dir: Union[str, Path],
+    root_dir: Optional[Union[str, Path]] = None,
+    seed: Optional[int] = None,
+    **observer_kwargs,
+) -> Path:
+    """Run the trial sequence of a recorded session again, headless.
+
+    The replay uses the session's saved configuration and seed, its data is
+    written to files below `root_dir`, by default `replays` in the session's
+    root directory. The simulated observer is seeded with `seed`, or with
+    the session's seed. Returns the directory of the replay.
+    """
+    from posner.data import load_sequence
+
+    subject_dir = Path(subject_dir)
+    subject_id = subject_dir.name
+    with open(subject_dir / f"{subject_id}_config.json") as f:
+        config_dict = json.load(f)
+    session_seed, blocks = load_sequence(subject_dir / f"{subject_id}_sequence.json")
+    if root_dir is None:
+        root_dir = Path(config_dict["root_dir"]) / "replays"
+    Path(root_dir).mkdir(parents=True, exist_ok=True)
+    # never write replays into the database of real sessions
+    config_dict.update(
+        root_dir=str(root_dir),
+        n_blocks=len(blocks),
+        seed=session_seed,
+        storage="files",
+        database=None,
+    )
+    config = Config.model_validate(config_dict)
+    if seed is None:
+        seed = session_seed
+    return simulate_session(config, subject_id, seed, blocks, **observer_kwargs)
+
+
+def _simulate_session(args) -> str:
+    config_dict, subject_id, seed, observer_kwargs = args
+    config = Config.model_validate(config_dict)
+    return str(simulate_session(config, subject_id, seed, **observer_kwargs))
+
+
+def run_simulations(
+    config_file: Union[str, Path],
+    n_sessions: int,
+    root_dir: Optional[Union[str, Path]] = None,
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    **observer_kwargs,
+) -> List[Path]:
+    """Simulate `n_sessions` sessions in parallel across a process pool."""
+    with open(config_file) as f:
+        config_dict = json.load(f)
+    if root_dir is not None:
+        config_dict["root_dir"] = str(root_dir)
+    seeds = np.random.SeedSequence(seed).generate_state(n_sessions).tolist()
+    prefix = f"sim{seed if seed is not None else ''}"
+    jobs = [
+        (config_dict, f"{prefix}_{i:05d}", session_seed, observer_kwargs)
+        for i, session_seed in enumerate(seeds)
+    ]
+    if workers == 1:
+        return [Path(d) for d in map(_simulate_session, jobs)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [Path(d) for d in executor.map(_simulate_session, jobs, chunksize=16)]
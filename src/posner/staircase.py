@@ -0,0 +1,56 @@
+"""Adaptive difficulty from the running accuracy of a participant.
+
+A weighted up-down staircase (Kaernbach, 1991) makes the task harder after
+every correct response and easier after every error. The step after an
+error is `step * target / (1 - target)`, so the parameter converges to the
+value at which a share of `target` responses are correct. Smaller values
+are harder, as for a shorter cue or a fainter target.
+"""
+
+import numpy as np
+from posner.config import Config
+
+
+class WeightedUpDown:
+    """Weighted up-down staircase on one trial parameter.
+
+    The values after a correct response and after an error are computed
+    when the previous update is done, so `update` only picks one of them.
+    A `start` outside of `minimum` and `maximum` is clamped to the range.
+    """
+
+    def __init__(
+        self,
+        start: float,
+        step: float,
+        target: float = 0.8,
+        minimum: float = -np.inf,
+        maximum: float = np.inf,
+    ):
+        self.step_down = step
+        self.step_up = step * target / (1 - target)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.n_updates = 0
+        self._set(min(max(start, minimum), maximum))
+
+    def _set(self, value: float) -> None:
+        self.value = value
+        self.after_correct = max(self.minimum, value - self.step_down)
+        self.after_error = min(self.maximum, value + self.step_up)
+
+    def update(self, correct: bool) -> float:
+        """Move to the value of the next trial and return it."""
+        self._set(self.after_correct if correct else self.after_error)
+        self.n_updates += 1
+        return self.value
+
+
+def make_staircase(config: Config) -> WeightedUpDown:
+    staircase = config.staircase
+    start = staircase.start
+    if start is None:
+        start = config.cue_dur if staircase.parameter == "cue_dur" else 1.0
+    return WeightedUpDown(
+        start, staircase.step, staircase.target, staircase.minimum, staircase.maximum
+    )
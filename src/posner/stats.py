@@ -0,0 +1,176 @@
+"""Robust response time statistics for many participants at once.
+
+Only correct responses are used for RTs. Responses faster than `min_rt` are
+anticipations and timeouts have no response, so neither counts. All
+statistics are computed for every participant together: the trials are
+sorted once by participant and RT, after which counts, medians and trimmed
+means of each condition are index arithmetic on the sorted arrays.
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+
+MIN_RT = 0.1  # faster responses are anticipations
+TRIM = 0.1  # share of trials cut from each end for the trimmed mean
+CONDITIONS = {"": None, "_valid": True, "_invalid": False}
+
+
+def correct_responses(df: pd.DataFrame) -> np.ndarray:
+    """Whether the response of each trial was correct."""
+    if "correct" in df:
+        return df["correct"].to_numpy(dtype=bool)
+    return df["response"].to_numpy(dtype=object) == df["side"].to_numpy(dtype=object)
+
+
+def rt_mask(
+    df: pd.DataFrame,
+    min_rt: float = MIN_RT,
+    max_rt: float = np.inf,
+    correct: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """The trials whose RT is used: correct and between `min_rt` and `max_rt`."""
+    if correct is None:
+        correct = correct_responses(df)
+    rt = df["response_time"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore"):
+        return correct & (rt >= min_rt) & (rt <= max_rt)
+
+
+def group_stats(codes: np.ndarray, values: np.ndarray, n_groups: int, trim: float = TRIM):
+    """Count, mean, median and trimmed mean of `values` per group code.
+
+    `values` must be sorted by code and then by value, for example with
+    `np.lexsort((values, codes))`. Returns four arrays of length `n_groups`,
+    NaN for groups without values.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    ends = starts + counts
+    cumsum = np.concatenate([[0.0], np.cumsum(values)])
+    empty = counts == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (cumsum[ends] - cumsum[starts]) / counts
+        lower = np.minimum(starts + (counts - 1) // 2, len(values) - 1)
+        upper = np.minimum(starts + counts // 2, len(values) - 1)
+        median = (values[lower] + values[upper]) / 2 if len(values) else mean.copy()
+        median[empty] = np.nan
+        # as scipy.stats.trim_mean, int(trim * n) values are cut from each end
+        cut = np.floor(counts * trim).astype(int)
+        kept = counts - 2 * cut
+        trimmed = (cumsum[ends - cut] - cumsum[starts + cut]) / kept
+        trimmed[kept <= 0] = np.nan
+    return counts, mean, median, trimmed
+
+
+def participant_stats(
+    df: pd.DataFrame,
+    by: str = "participant",
+    trim: float = TRIM,
+    min_rt: float = MIN_RT,
+    max_rt: float = np.inf,
+    n_boot: int = 0,
+    ci: float = 0.95,
+    rng: Optional[np.random.Generator] = None,
+) -> pd.DataFrame:
+    """RT statistics and accuracy of every participant in `df`.
+
+    `df` has one row per trial with the participant in column `by`. For all
+    trials, valid and invalid cues there is the number of RTs used, their
+    mean, median and trimmed mean. The cueing effect is the median RT of
+    invalid minus valid cues. With `n_boot` > 0 a percentile bootstrap `ci`
+    interval of the cueing effect is added.
+    """
+    codes, participants = pd.factorize(df[by].astype(str), sort=True)
+    n_groups = len(participants)
+    n_trials = np.bincount(codes, minlength=n_groups)
+    correct = correct_responses(df)
+    stats = {
+        "n_trials": n_trials,
+        "accuracy": np.bincount(codes, weights=correct, minlength=n_groups) / n_trials,
+    }
+    used = rt_mask(df, min_rt, max_rt, correct)
+    rt = df["response_time"].to_numpy(dtype=float)
+    valid = df["valid"].to_numpy(dtype=bool)
+    # One sort serves every condition, masking keeps the order
+    order = np.lexsort((rt, codes))
+    codes, rt, valid, used = codes[order], rt[order], valid[order], used[order]
+    for suffix, condition in CONDITIONS.items():
+        mask = used if condition is None else used & (valid == condition)
+        counts, mean, median, trimmed = group_stats(codes[mask], rt[mask], n_groups, trim)
+        stats[f"n_rt{suffix}"] = counts
+        stats[f"mean_rt{suffix}"] = mean
+        stats[f"median_rt{suffix}"] = median
+        stats[f"trimmed_mean_rt{suffix}"] = trimmed
+    stats["cueing_effect"] = stats["median_rt_invalid"] - stats["median_rt_valid"]
+    if n_boot > 0:
+        low, high = bootstrap_cueing_effect(
+            codes[used], valid[used], rt[used], n_groups, n_boot, ci, rng
+        )
+        stats["cueing_effect_low"] = low
+        stats["cueing_effect_high"] = high
+    return pd.DataFrame(stats, index=pd.Index(participants, name=by))
+
+
+def bootstrap_cueing_effect(
+    codes: np.ndarray,
+    valid: np.ndarray,
+    values: np.ndarray,
+    n_groups: int,
+    n_boot: int = 1000,
+    ci: float = 0.95,
+    rng: Optional[np.random.Generator] = None,
+):
+    """Percentile bootstrap interval of the median cueing effect per group.
+
+    The trials of each condition are resampled separately, all `n_boot`
+    resamples of a participant are drawn as one array.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    order = np.lexsort((values, valid, codes))
+    codes, valid, values = codes[order], valid[order], values[order]
+    bounds = np.searchsorted(codes * 2 + valid, np.arange(2 * n_groups + 1))
+    quantiles = [(1 - ci) / 2, (1 + ci) / 2]
+    low = np.full(n_groups, np.nan)
+    high = np.full(n_groups, np.nan)
+    for group in range(n_groups):
+        invalid_rts = values[bounds[2 * group] : bounds[2 * group + 1]]
+        valid_rts = values[bounds[2 * group + 1] : bounds[2 * group + 2]]
+        if len(invalid_rts) == 0 or len(valid_rts) == 0:
+            continue
+        effect = _bootstrap_medians(invalid_rts, n_boot, rng) - _bootstrap_medians(
+            valid_rts, n_boot, rng
+        )
+        low[group], high[group] = np.quantile(effect, quantiles)
+    return low, high
+
+
+def _bootstrap_medians(values: np.ndarray, n_boot: int, rng: np.random.Generator):
+    samples = values[rng.integers(0, len(values), (n_boot, len(values)))]
+    return np.median(samples, axis=1)
+
+
+def load_trials(root_dir: Union[str, Path]) -> pd.DataFrame:
+    """The trials of every finished session below `root_dir`.
+
+    A session's parquet file is read instead of its CSV if it has one.
+    """
+    from posner.data import read_session
+
+    frames = []
+    for subject_dir in sorted(Path(root_dir).iterdir()):
+        if not subject_dir.is_dir():
+            continue
+        session_path = subject_dir / f"{subject_dir.name}_data.parquet"
+        csv_path = subject_dir / f"{subject_dir.name}_data.csv"
+        if session_path.exists():
+            df = read_session(session_path)[0]
+        elif csv_path.exists():
+            df = pd.read_csv(csv_path, dtype={"side": object, "response": object})
+        else:
+            continue
+        frames.append(df.assign(participant=subject_dir.name))
+    if not frames:
+        return pd.DataFrame(columns=["participant", "side", "valid", "response", "response_time"])
+    return pd.concat(frames, ignore_index=True)
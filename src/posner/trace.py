@@ -0,0 +1,194 @@
+"""Timing traces of experiment sessions.
+
+A `Tracer` records when every phase of a trial hit the screen, how long the
+stimuli took to build, how late response polling started after the target
+and how long the gaps between trials were. Traces are saved as Chrome trace
+JSON (open them in chrome://tracing or https://ui.perfetto.dev) or as CSV,
+and `summarize` reports the distribution of every interval.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+import numpy as np
+import pandas as pd
+
+TRACE_COLUMNS = ["name", "category", "block", "trial", "start", "duration", "args"]
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+
+class Tracer:
+    """Collects the timing events of one session.
+
+    Times are in seconds from `time_fn`, which should be the clock that
+    timestamps the screen flips. Recording an event only appends a tuple, so
+    tracing doesn't change the timing it measures. A tracer that is not
+    `enabled` records nothing.
+    """
+
+    def __init__(
+        self,
+        time_fn: Callable[[], float] = time.perf_counter,
+        enabled: bool = True,
+        **metadata,
+    ):
+        self.time_fn = time_fn
+        self.enabled = enabled
+        self.metadata = metadata
+        self.events = []
+        self.block = -1
+        self.trial = -1
+
+    def start_block(self) -> None:
+        self.block += 1
+
+    def start_trial(self) -> None:
+        self.trial += 1
+
+    def add(
+        self, name: str, category: str, start: float, duration: float = 0.0, **args
+    ) -> None:
+        if self.enabled:
+            self.events.append(
+                (name, category, self.block, self.trial, start, duration, args)
+            )
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        if not self.enabled:
+            yield
+            return
+        start = self.time_fn()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, self.time_fn() - start, **args)
+
+    def add_flips(self, timestamps: Dict[str, List[float]]) -> None:
+        if not self.enabled:
+            return
+        for phase, flips in timestamps.items():
+            for frame, flip in enumerate(flips):
+                self.add("flip", "screen", flip, phase=phase, frame=frame)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.events, columns=TRACE_COLUMNS)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Save as Chrome trace JSON, or as CSV if `path` ends with .csv."""
+        path = Path(path)
+        if path.suffix == ".csv":
+            df = self.to_frame()
+            df["args"] = [json.dumps(args) for args in df["args"]]
+            df.to_csv(path, index=False)
+            return
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "traceEvents": [chrome_event(*event) for event in self.events],
+                    "displayTimeUnit": "ms",
+                    "otherData": self.metadata,
+                },
+                f,
+            )
+
+
+def chrome_event(name, category, block, trial, start, duration, args) -> dict:
+    event = {
+        "name": name,
+        "cat": category,
+        "ts": start * 1e6,
+        "pid": 1,
+        "tid": 1,
+        "args": {"block": block, "trial": trial, **args},
+    }
+    if duration > 0:
+        event.update(ph="X", dur=duration * 1e6)
+    else:
+        event.update(ph="i", s="t")
+    return event
+
+
+def load_trace(path: Union[str, Path]) -> pd.DataFrame:
+    """Read a trace saved by `Tracer.save` into the columns of `TRACE_COLUMNS`."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        df = pd.read_csv(path)
+        df["args"] = [json.loads(args) for args in df["args"]]
+        return df
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    rows = []
+    for event in events:
+        args = dict(event["args"])
+        block = args.pop("block")
+        trial = args.pop("trial")
+        rows.append(
+            (
+                event["name"],
+                event["cat"],
+                block,
+                trial,
+                event["ts"] / 1e6,
+                event.get("dur", 0.0) / 1e6,
+                args,
+            )
+        )
+    return pd.DataFrame(rows, columns=TRACE_COLUMNS)
+
+
+def trace_intervals(trace: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """The intervals of a trace in seconds, by what they measure.
+
+    - `frame_interval`: between consecutive flips of a trial
+    - `fixation`, `cue`: from the onset of the phase to the next phase
+    - `input_latency`: from the target flip until responses are polled
+    - `trial_gap`: from the end of a response to the next fixation flip of
+      the same block
+    - `build_stimuli`, `prepare_next`, `trial`: how long these took
+    """
+    flips = trace[trace["name"] == "flip"]
+    phases = [args["phase"] for args in flips["args"]]
+    flips = flips.assign(phase=phases)
+    onsets = flips.groupby(["trial", "phase"])["start"].min().unstack()
+    flip_times = flips.sort_values(["trial", "start"]).groupby("trial")["start"]
+    intervals = {"frame_interval": flip_times.diff().dropna().to_numpy()}
+    if {"fixation", "cue", "target"} <= set(onsets.columns):
+        intervals["fixation"] = (onsets["cue"] - onsets["fixation"]).to_numpy()
+        intervals["cue"] = (onsets["target"] - onsets["cue"]).to_numpy()
+    for name in ["build_stimuli", "prepare_next", "input_latency", "trial"]:
+        intervals[name] = trace.loc[trace["name"] == name, "duration"].to_numpy()
+    responses = trace[trace["name"] == "response"]
+    if len(responses) and "fixation" in onsets.columns:
+        response_end = (responses["start"] + responses["duration"]).to_numpy()
+        next_trial = responses["trial"].to_numpy() + 1
+        next_fixation = onsets["fixation"].reindex(next_trial).to_numpy()
+        # the break between blocks is not a gap between trials
+        blocks = flips.groupby("trial")["block"].first()
+        same_block = blocks.reindex(next_trial).to_numpy() == responses["block"].to_numpy()
+        intervals["trial_gap"] = (next_fixation - response_end)[same_block]
+    return intervals
+
+
+def summarize(*traces: pd.DataFrame) -> pd.DataFrame:
+    """Distribution of every interval of one or more traces in milliseconds."""
+    intervals = {}
+    for trace in traces:
+        for name, values in trace_intervals(trace).items():
+            intervals.setdefault(name, []).append(values)
+    rows = {}
+    for name, values in intervals.items():
+        values = np.concatenate(values).astype(float) * 1000
+        if len(values) == 0:
+            continue
+        rows[name] = {
+            "count": len(values),
+            "mean": values.mean(),
+            "std": values.std(),
+            "min": values.min(),
+            **{key: np.quantile(values, q) for key, q in QUANTILES.items()},
+            "max": values.max(),
+        }
+    return pd.DataFrame.from_dict(rows, orient="index")
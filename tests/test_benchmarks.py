@@ -0,0 +1,155 @@
+"""Timing of the hot paths against fixed budgets.
+
+Every benchmark takes the best of a few repeats and fails if that is over
+its budget in `BUDGETS`. The budgets are about five times what the
+benchmarks take on a laptop, so they only fail on real regressions, not on
+a busy CI box. Windows and stimuli are mocked, nothing needs a screen.
+Run only these with `pytest -m benchmark`, or skip them with
+`pytest -m "not benchmark"`.
+"""
+
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+from psychopy import core
+import leaderboard
+from leaderboard import Leaderboard
+from posner import config as posner_config
+from posner.config import Config, load_config
+from posner.experiment import make_scheduler, run_block, run_trial
+
+# seconds
+BUDGETS = {
+    "trial_overhead": 0.001,
+    "block_trial": 0.001,
+    "process_participant": 0.02,
+    "update_leaderboard": 15e-6,
+    "render_row": 60e-6,
+    "load_config": 0.0002,
+    "import_posner_config": 1.0,
+    "import_leaderboard": 3.0,
+}
+# how much slower per trial or row large inputs may be than small ones
+MAX_SCALING = 2.0
+
+pytestmark = pytest.mark.benchmark
+
+
+def best_time(fn, repeat=5, number=1):
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+@pytest.fixture
+def no_wait_config(config_dict):
+    return Config(**{**config_dict, "fix_dur": 0, "cue_dur": 0})
+
+
+def test_trial_overhead(no_wait_config, mock_window, mock_circle, mock_rect, mock_waitKeys):
+    # without waits, everything a trial takes is overhead
+    clock = core.Clock()
+    scheduler = make_scheduler(mock_window, no_wait_config)
+
+    def trial():
+        run_trial(mock_window, clock, "left", True, no_wait_config, scheduler=scheduler)
+
+    assert best_time(trial, number=20) < BUDGETS["trial_overhead"]
+
+
+def test_run_block_scales_linearly(
+    config_dict, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    per_trial = {}
+    for n_trials in [100, 1000]:
+        config = Config(**{**config_dict, "fix_dur": 0, "cue_dur": 0, "n_trials": n_trials})
+        elapsed = best_time(lambda: run_block(mock_window, core.Clock(), config), repeat=3)
+        per_trial[n_trials] = elapsed / n_trials
+    assert per_trial[1000] < BUDGETS["block_trial"]
+    assert per_trial[1000] < MAX_SCALING * per_trial[100]
+
+
+def test_process_participant_data_throughput(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        leaderboard, "_leaderboard", Leaderboard(str(tmp_path / "leaderboard.csv"), 60)
+    )
+    rng = np.random.default_rng(0)
+    n_participants, n_trials = 50, 200
+    for i in range(n_participants):
+        participant_dir = tmp_path / f"p{i}"
+        participant_dir.mkdir()
+        side = rng.choice(["left", "right"], n_trials)
+        pd.DataFrame(
+            {
+                "side": side,
+                "valid": rng.random(n_trials) < 0.8,
+                "response": np.where(rng.random(n_trials) < 0.95, side, "left"),
+                "response_time": rng.uniform(0.2, 0.6, n_trials),
+            }
+        ).to_csv(participant_dir / f"p{i}_data.csv", index=False)
+
+    def process_all():
+        for i in range(n_participants):
+            leaderboard.process_participant_data(f"p{i}", str(tmp_path / f"p{i}"))
+
+    elapsed = best_time(process_all, repeat=3)
+    assert len(leaderboard.get_leaderboard()) == n_participants
+    assert elapsed / n_participants < BUDGETS["process_participant"]
+
+
+def test_update_leaderboard_throughput(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        leaderboard, "_leaderboard", Leaderboard(str(tmp_path / "leaderboard.csv"), 60)
+    )
+    n = 10_000
+    rts = np.random.default_rng(0).uniform(0.2, 0.6, n).tolist()
+
+    def update_all():
+        for i, rt in enumerate(rts):
+            leaderboard.update_leaderboard(f"p{i}", rt, rt, rt, 0.0, 0.9)
+
+    assert best_time(update_all, repeat=3) / n < BUDGETS["update_leaderboard"]
+
+
+def test_render_time_scales_with_participants():
+    per_row = {}
+    for n in [1_000, 10_000]:
+        rts = np.sort(np.random.default_rng(0).uniform(0.2, 0.6, n))
+        df = pd.DataFrame(
+            {
+                "Participant": [f"p{i:05d}" for i in range(n)],
+                "Response Time (s)": rts,
+                "Response Time Valid Cues (s)": rts,
+                "Response Time Invalid Cues (s)": rts,
+                "Response Time Difference (s)": rts,
+                "Accuracy": np.full(n, 0.9),
+            }
+        )
+        per_row[n] = best_time(lambda: leaderboard.render_leaderboard(df), repeat=3) / n
+        assert leaderboard.render_leaderboard(df).count("<tr class=") == n
+    assert per_row[10_000] < BUDGETS["render_row"]
+    assert per_row[10_000] < MAX_SCALING * per_row[1_000]
+
+
+def test_load_config_time(write_config):
+    def load():
+        posner_config._config_cache.clear()
+        load_config(write_config, acquire_devices=False)
+
+    assert best_time(load, number=10) < BUDGETS["load_config"]
+
+
+@pytest.mark.parametrize("module", ["posner_config", "leaderboard"])
+def test_import_time(module):
+    name = {"posner_config": "posner.config"}.get(module, module)
+
+    def run():
+        subprocess.run(
+            [sys.executable, "-c", f"import {name}"],
+            check=True,
+            cwd=Path(leaderboard.__file__).parent,
+        )
+
+    assert best_time(run, repeat=3) < BUDGETS[f"import_{module}"]
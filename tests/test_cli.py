@@ -0,0 +1,36 @@
+import subprocess
+import sys
+import pytest
+from posner.cli import main_cli
+
+HEAVY_MODULES = ["psychopy", "pygame", "pandas"]
+# generous upper bound for importing the CLI, PsychoPy alone takes seconds
+IMPORT_TIME_BUDGET = 1.0
+
+
+def test_cli_import_is_light():
+    code = (
+        "import sys, time\n"
+        "tic = time.perf_counter()\n"
+        "import posner.cli, posner.config\n"
+        "print(time.perf_counter() - tic)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    import_time, loaded = float(out[0]), out[1]
+    print(f"posner.cli import time: {import_time * 1000:.1f} ms")
+    assert loaded == ""
+    assert import_time < IMPORT_TIME_BUDGET
+
+
+def test_validate(write_config, capsys):
+    main_cli(["validate", write_config])
+    assert "is a valid configuration" in capsys.readouterr().out
+
+
+def test_validate_invalid_config(write_config, tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        main_cli(["validate", str(tmp_path / "missing.json")])
+    assert exit_info.value.code == 1
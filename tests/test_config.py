@@ -1,4 +1,9 @@
+import json
+import sys
+from pathlib import Path
+from unittest import mock
 import pytest
+from posner.config import config_schema, open_devices
 from posner.experiment import load_config, Config
 from pydantic import ValidationError
 
@@ -31,3 +36,74 @@ def test_wrong_types_are_detected(config_dict):
         with pytest.raises(ValidationError):
             Config(**wrong_config)
 
+
+
+def test_load_config_is_cached(write_config):
+    config = load_config(write_config)
+    assert load_config(write_config) is config
+    # a changed file is validated again
+    with open(write_config) as f:
+        config_dict = json.load(f)
+    config_dict["n_blocks"] = 3
+    with open(write_config, "w") as f:
+        json.dump(config_dict, f)
+    assert load_config(write_config).n_blocks == 3
+
+
+def test_validation_does_not_acquire_devices(config_dict, tmp_path):
+    config_dict.update(root_dir=str(tmp_path), input_method="Controller")
+    path = tmp_path / "controller.json"
+    path.write_text(json.dumps(config_dict))
+    with mock.patch("pygame.init") as init:
+        config = load_config(path, acquire_devices=False)
+    init.assert_not_called()
+    assert config.controller is None
+    with mock.patch("pygame.joystick.get_count", return_value=0), mock.patch(
+        "pygame.joystick.init"
+    ), pytest.raises(ValueError, match="No joystick"):
+        open_devices(config)
+
+
+def test_hardware_keyboard_needs_psychtoolbox(config_dict, tmp_path):
+    config_dict.update(root_dir=str(tmp_path), keyboard_backend="hardware")
+    config = Config(**config_dict)
+    with mock.patch("posner.keyboard.have_ptb", return_value=False), mock.patch(
+        "posner.keyboard.get_listener"
+    ) as get_listener, pytest.raises(ValueError, match="psychtoolbox"):
+        open_devices(config)
+    get_listener.assert_not_called()
+
+
+def test_listener_reads_keyboard_with_psychtoolbox():
+    from posner.keyboard import KeyboardListener
+
+    with mock.patch("psychopy.hardware.keyboard.Keyboard") as Keyboard:
+        Keyboard.return_value.getKeys.return_value = []
+        KeyboardListener().stop()
+    Keyboard.assert_called_once_with(backend="ptb")
+
+
+def test_parquet_sessions_need_pyarrow(config_dict, tmp_path):
+    config_dict.update(root_dir=str(tmp_path), session_format="parquet")
+    config = Config(**config_dict)
+    with mock.patch.dict(sys.modules, {"pyarrow": None}), pytest.raises(
+        ImportError, match="pyarrow"
+    ):
+        open_devices(config)
+
+
+def test_schema_is_up_to_date():
+    path = Path(__file__).parents[1] / "config.schema.json"
+    with open(path) as f:
+        assert json.load(f) == config_schema(), "run `posner schema --output config.schema.json`"
+
+
+def test_parameters_match_schema():
+    jsonschema = pytest.importorskip("jsonschema")
+    root = Path(__file__).parents[1]
+    with open(root / "parameters.json") as f:
+        parameters = json.load(f)
+    jsonschema.validate(parameters, config_schema())
+    parameters["p_valid"] = 2
+    with pytest.raises(jsonschema.ValidationError):
+        jsonschema.validate(parameters, config_schema())
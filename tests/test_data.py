@@ -0,0 +1,66 @@
+import time
+import pandas as pd
+import pytest
+from posner.data import (
+    TRIAL_COLUMNS,
+    TrialTable,
+    TrialWriter,
+    partial_path,
+    read_partial_csv,
+    read_session,
+    write_session,
+)
+
+
+def test_trial_writer_streams_rows(tmp_path):
+    path = tmp_path / "1_data.csv"
+    writer = TrialWriter(path, flush_interval=0.01)
+    for i in range(3):
+        writer.write({"side": "left", "valid": True, "response": "left", "response_time": i})
+    time.sleep(0.2)
+    assert not path.exists()
+    lines = read_partial_csv(partial_path(path)).splitlines()
+    assert lines[0] == "side,valid,response,response_time"
+    assert len(lines) == 4
+    writer.close()
+    assert path.exists()
+    assert not partial_path(path).exists()
+    df = pd.read_csv(path)
+    assert df.shape == (3, 4)
+    assert df["response_time"].tolist() == [0, 1, 2]
+
+
+def test_read_partial_csv_drops_incomplete_line(tmp_path):
+    path = tmp_path / "1_data.csv.part"
+    path.write_text("side,valid\nleft,True\nrig")
+    assert read_partial_csv(path) == "side,valid\nleft,True\n"
+
+
+def test_trial_table_dtypes():
+    table = TrialTable(4)
+    table.append({"side": "left", "valid": True, "response": "left", "response_time": 0.3})
+    table.append({"side": "right", "valid": False, "response": None, "response_time": 1.5})
+    df = table.to_frame()
+    assert len(table) == 2
+    assert df.columns.tolist() == list(TRIAL_COLUMNS)
+    assert df["valid"].dtype == bool
+    assert df["response_time"].dtype == float
+    assert df["response"].isna().tolist() == [False, True]
+    assert df["target_onset"].isna().all()
+
+
+def test_session_roundtrip(tmp_path):
+    pytest.importorskip("pyarrow")
+    table = TrialTable(3)
+    table.append({"side": "left", "valid": True, "response": "left", "response_time": 0.3})
+    table.append({"side": "right", "valid": False, "response": None, "response_time": 1.5})
+    table.append({"side": "right", "valid": True, "response": "left", "response_time": 0.4})
+    metadata = {"seed": 1, "refresh_rate": 60.0, "config": {"n_trials": 3}}
+    write_session(tmp_path / "1_data.parquet", table.to_frame(), metadata)
+    df, loaded = read_session(tmp_path / "1_data.parquet")
+    assert loaded == metadata
+    assert df["valid"].dtype == bool
+    assert isinstance(df["side"].dtype, pd.CategoricalDtype)
+    assert df["side"].cat.categories.tolist() == ["left", "right"]
+    assert df["response"].isna().tolist() == [False, True, False]
+    assert df["response_time"].tolist() == [0.3, 1.5, 0.4]
@@ -1,6 +1,9 @@
-import csv
+import json
+import sqlite3
 import pytest
-from posner.experiment import make_subject_dir
+from posner.experiment import make_subject_dir, open_store, Config
+from posner.data import SessionStore
+from posner.simulation import run_simulations
 
 
 def test_subject_dir_creation(create_temp_subject_dir):
@@ -16,3 +19,66 @@ def test_subject_dir_overwriting(tmp_path, config_dict):
     # Try to create the same subject dir again - should return None
     result = make_subject_dir(config, "1")
     assert result is None
+
+
+def test_store_participants_are_unique(tmp_path, config_dict):
+    config_dict["root_dir"] = str(tmp_path)
+    config_dict["storage"] = "sqlite"
+    config = Config(**config_dict)
+    store = open_store(config)
+    assert make_subject_dir(config, "1", store) is not None
+    assert make_subject_dir(config, "1", store) is None
+    assert (tmp_path / "posner.db").exists()
+
+
+def test_store_metrics(tmp_path):
+    store = SessionStore(tmp_path / "posner.db")
+    trials = [
+        ("left", True, "left", 0.3),
+        ("right", True, "left", 0.5),
+        ("left", False, "left", 0.6),
+        ("right", False, None, 1.5),
+    ]
+    for participant in ["a", "b"]:
+        assert store.add_participant(participant)
+        with store.trial_writer(participant) as writer:
+            for side, valid, response, response_time in trials:
+                writer.write(
+                    {
+                        "side": side,
+                        "valid": valid,
+                        "response": response,
+                        "response_time": response_time,
+                    }
+                )
+    rows = {row[0]: row for row in store.participant_metrics()}
+    # only correct responses count for the RTs
+    assert rows["a"][1:6] == pytest.approx((0.45, 0.3, 0.6, 0.3, 0.5))
+    assert len(store.trials("b")) == 4
+    # nothing new since the last trial
+    assert store.participant_metrics(after=max(row[-1] for row in rows.values())) == []
+
+
+def test_booths_share_a_store(write_config, tmp_path):
+    config = json.load(open(write_config))
+    config["storage"] = "sqlite"
+    json.dump(config, open(write_config, "w"))
+    run_simulations(write_config, 12, workers=4, seed=0)
+    store = SessionStore(tmp_path / "posner.db")
+    rows = store.participant_metrics()
+    assert len(rows) == 12
+    n_trials = store.connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+    assert n_trials == 12 * config["n_blocks"] * config["n_trials"]
+
+
+def test_store_adds_missing_columns(tmp_path):
+    path = tmp_path / "sessions.db"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE trials (participant TEXT, trial INTEGER, side TEXT, timestamp REAL)"
+    )
+    connection.close()
+    store = SessionStore(path)
+    columns = [row[1] for row in store.connection.execute("PRAGMA table_info(trials)")]
+    store.close()
+    assert "staircase_value" in columns
@@ -1,11 +1,29 @@
 from pathlib import Path
 import time
-from posner.experiment import run_trial, run_block, run_experiment, load_config, Config
-from psychopy import core
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+import pygame
+import pytest
+from posner.experiment import (
+    run_trial,
+    run_block,
+    run_experiment,
+    load_config,
+    make_scheduler,
+    wait_for_response,
+    FrameDropError,
+    Config,
+    Stimuli,
+)
+from psychopy import core, logging
+from posner.keyboard import KeyboardListener
+from posner.trace import Tracer
 
 WAITKEY_CALL_PER_TRIAL = 1
-CIRCLE_CALL_PER_TRIAL = 3
-RECT_CALL_PER_TRIAL = 8
+# stimuli are built once per window and config, not once per trial
+CIRCLE_CALLS = 3
+RECT_CALLS = 4
 
 
 def test_run_trial_calls(
@@ -14,8 +32,8 @@ def test_run_trial_calls(
     clock = core.Clock()
     run_trial(mock_window, clock, side="left", valid=True, config=create_config)
     assert mock_waitKeys.call_count == WAITKEY_CALL_PER_TRIAL
-    assert mock_circle.call_count == CIRCLE_CALL_PER_TRIAL
-    assert mock_rect.call_count == RECT_CALL_PER_TRIAL
+    assert mock_circle.call_count == CIRCLE_CALLS
+    assert mock_rect.call_count == RECT_CALLS
 
 
 def test_run_block_calls(
@@ -24,8 +42,8 @@ def test_run_block_calls(
     clock = core.Clock()
     _ = run_block(mock_window, clock, create_config)
     assert mock_waitKeys.call_count == WAITKEY_CALL_PER_TRIAL * create_config.n_trials
-    assert mock_circle.call_count == CIRCLE_CALL_PER_TRIAL * create_config.n_trials
-    assert mock_rect.call_count == RECT_CALL_PER_TRIAL * create_config.n_trials
+    assert mock_circle.call_count == CIRCLE_CALLS
+    assert mock_rect.call_count == RECT_CALLS
 
 
 def test_run_experiment_calls(
@@ -66,6 +84,7 @@ def test_run_experiment_writes_files(
 
     files = list(Path(config.root_dir).glob("data/*/*.csv"))
     assert len(files) >= 1
+    assert len(list(Path(config.root_dir).glob("data/*/*_sequence.json"))) == 1
 
 
 def test_trial_timing(
@@ -78,6 +97,34 @@ def test_trial_timing(
     assert abs(elapsed - (create_config.fix_dur + create_config.cue_dur)) < 0.01
 
 
+def test_response_time_is_measured_from_flip(
+    create_config, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    # real windows return flip times of logging.defaultClock
+    mock_window.flip.side_effect = logging.defaultClock.getTime
+    mock_waitKeys.side_effect = lambda keyList, maxWait=None: ["left"]
+    config = create_config.model_copy(update={"fix_dur": 0, "cue_dur": 0})
+    response, response_time = run_trial(mock_window, core.Clock(), "left", True, config)
+    max_wait = mock_waitKeys.call_args.kwargs["maxWait"]
+    assert 0 < max_wait <= config.max_wait
+    assert response == "left"
+    assert 0 <= response_time < 0.1
+
+
+def test_traced_input_latency_is_on_flip_clock(
+    create_config, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    mock_window.flip.side_effect = logging.defaultClock.getTime
+    config = create_config.model_copy(update={"fix_dur": 0, "cue_dur": 0})
+    tracer = Tracer(core.getTime)
+    tracer.start_block()
+    tracer.start_trial()
+    run_trial(mock_window, core.Clock(), "left", True, config, tracer=tracer)
+    trace = tracer.to_frame().set_index("name")
+    assert 0 <= trace.loc["input_latency", "duration"] < 0.1
+    assert 0 <= trace.loc["response", "duration"] < 0.1
+
+
 def test_block_data_is_valid(
     create_config, mock_window, mock_circle, mock_rect, mock_waitKeys
 ):
@@ -88,3 +135,181 @@ def test_block_data_is_valid(
     assert df["valid"].isin([True, False]).all()
     assert df["response"].isin(["left", "right"]).all()
     assert all([isinstance(d, float) for d in df["response_time"]])
+
+
+def test_run_block_draws_next_fixation_during_response(
+    create_config, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    events = []
+    stimuli = Stimuli(mock_window, create_config)
+    stimuli.fixation = mock.Mock()
+    stimuli.fixation.draw.side_effect = lambda: events.append("fixation")
+    mock_window.flip.side_effect = lambda: events.append("flip")
+    mock_waitKeys.side_effect = lambda keyList, maxWait=None: events.append("wait") or ["left"]
+    run_block(mock_window, core.Clock(), create_config, stimuli)
+    waits = [i for i, event in enumerate(events) if event == "wait"]
+    assert len(waits) == create_config.n_trials
+    # the next fixation is drawn between the target flip and the response
+    assert all(events[i - 2 : i] == ["flip", "fixation"] for i in waits[:-1])
+    assert events[waits[-1] - 1] == "flip"
+    # and not drawn again by the fixation phase
+    assert events.count("fixation") == 2 * create_config.n_trials
+
+
+def test_frame_scheduler_counts_flips(
+    create_config, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    config = create_config.model_copy(update={"timing": "frames", "refresh_rate": 60})
+    flip_times = iter(np.arange(1000) / 60)
+    mock_window.flip.side_effect = lambda: next(flip_times)
+    scheduler = make_scheduler(mock_window, config)
+    run_trial(mock_window, core.Clock(), "left", True, config, scheduler=scheduler)
+    assert len(scheduler.timestamps["fixation"]) == 30
+    assert len(scheduler.timestamps["cue"]) == 30
+    assert len(scheduler.timestamps["target"]) == 1
+    soa = scheduler.timestamps["target"][0] - scheduler.timestamps["cue"][0]
+    assert soa == pytest.approx(config.cue_dur)
+    assert scheduler.dropped_frames == 0
+
+
+def test_frame_scheduler_detects_dropped_frames(create_config, mock_window):
+    config = create_config.model_copy(
+        update={"timing": "frames", "refresh_rate": 60, "on_frame_drop": "raise"}
+    )
+    flip_times = iter([0, 1 / 60, 3 / 60])
+    mock_window.flip.side_effect = lambda: next(flip_times)
+    scheduler = make_scheduler(mock_window, config)
+    scheduler.start_trial()
+    with pytest.raises(FrameDropError):
+        scheduler.run_phase("fixation", lambda: None, 3 / 60)
+
+
+def test_controller_responses_are_event_driven(create_config):
+    controller = mock.Mock(spec=pygame.joystick.JoystickType)
+    controller.get_instance_id.return_value = 0
+    config = create_config.model_copy(
+        update={"input_method": "Controller", "controller": controller}
+    )
+    events = [
+        pygame.event.Event(pygame.JOYBUTTONDOWN, button=3, instance_id=0),
+        pygame.event.Event(pygame.JOYBUTTONDOWN, button=4, instance_id=1),
+        pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, instance_id=0),
+    ]
+    with mock.patch("pygame.event.clear"), mock.patch(
+        "pygame.event.wait", side_effect=events
+    ) as wait:
+        response, response_time = wait_for_response(
+            config, core.Clock(), keys=["left", "right"], max_wait=2
+        )
+    # the exit button and the other controller are ignored
+    assert response == "right"
+    assert wait.call_count == 3
+    assert 0 <= response_time < 2
+
+
+class FakeKeyboard:
+    """Hands out key presses like psychopy.hardware.keyboard.Keyboard."""
+
+    def __init__(self, presses):
+        self.clock = core.Clock()
+        self.presses = presses
+
+    def getKeys(self, waitRelease=False, clear=True):
+        presses, self.presses = self.presses, []
+        return [SimpleNamespace(name=name, rt=rt) for name, rt in presses]
+
+
+def test_keyboard_listener_uses_press_times(create_config):
+    keyboard = FakeKeyboard([])
+    # flips are timed by logging.defaultClock, presses on the absolute time base
+    onset = logging.defaultClock.getTime()
+    start = keyboard.clock.getLastResetTime() - core.monotonicClock.getLastResetTime()
+    # pressed before the target, a key that doesn't count, then the response
+    keyboard.presses = [
+        ("left", onset - start - 0.1),
+        ("space", onset - start + 0.05),
+        ("right", onset - start + 0.2),
+    ]
+    listener = KeyboardListener(keyboard)
+    config = create_config.model_copy(
+        update={"keyboard_backend": "hardware", "keyboard": listener}
+    )
+    try:
+        response, response_time = wait_for_response(
+            config, core.Clock(), keys=["left", "right"], max_wait=2, onset=onset
+        )
+    finally:
+        listener.stop()
+    # the RT is the time of the press, not of when it was read
+    assert response == "right"
+    assert response_time == pytest.approx(0.2)
+
+
+def test_keyboard_listener_times_out(create_config):
+    listener = KeyboardListener(FakeKeyboard([]))
+    config = create_config.model_copy(
+        update={"keyboard_backend": "hardware", "keyboard": listener}
+    )
+    try:
+        response, response_time = wait_for_response(
+            config,
+            core.Clock(),
+            keys=["left", "right"],
+            max_wait=0.05,
+            onset=logging.defaultClock.getTime(),
+        )
+    finally:
+        listener.stop()
+    assert response is None
+    assert 0.05 <= response_time < 1
+
+
+def test_controller_response_times_out(create_config):
+    controller = mock.Mock(spec=pygame.joystick.JoystickType)
+    controller.get_instance_id.return_value = 0
+    config = create_config.model_copy(
+        update={"input_method": "Controller", "controller": controller}
+    )
+
+    def wait(timeout):
+        time.sleep(timeout / 1000)
+        return pygame.event.Event(pygame.NOEVENT)
+
+    with mock.patch("pygame.event.clear"), mock.patch(
+        "pygame.event.wait", side_effect=wait
+    ):
+        response, response_time = wait_for_response(
+            config, core.Clock(), keys=["left", "right"], max_wait=0.05
+        )
+    assert response is None
+    assert response_time >= 0.05
+
+
+def test_controller_presses_while_preparing_count(
+    create_config, mock_window, mock_circle, mock_rect
+):
+    controller = mock.Mock(spec=pygame.joystick.JoystickType)
+    controller.get_instance_id.return_value = 0
+    config = create_config.model_copy(
+        update={"input_method": "Controller", "controller": controller}
+    )
+    calls = []
+
+    def wait(timeout):
+        calls.append("wait")
+        return pygame.event.Event(pygame.JOYBUTTONDOWN, button=0, instance_id=0)
+
+    with mock.patch(
+        "pygame.event.clear", side_effect=lambda *args: calls.append("clear")
+    ), mock.patch("pygame.event.wait", side_effect=wait):
+        response, _ = run_trial(
+            mock_window,
+            core.Clock(),
+            "right",
+            True,
+            config,
+            prepare_next=lambda: calls.append("prepare"),
+        )
+    # the queue is cleared before the target, not after preparing the next trial
+    assert calls == ["clear", "prepare", "wait"]
+    assert response == "right"
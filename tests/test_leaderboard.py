@@ -0,0 +1,247 @@
+import json
+import os
+import time
+from unittest import mock
+import numpy as np
+import pandas as pd
+import pytest
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileMovedEvent
+import leaderboard
+from leaderboard import ExperimentHandler, Leaderboard, LEADERBOARD_COLUMNS
+from posner.simulation import run_simulations
+
+
+def test_leaderboard_stays_sorted(tmp_path):
+    board = Leaderboard(str(tmp_path / "leaderboard.csv"), snapshot_delay=60)
+    board.update("a", 0.5, 0.45, 0.55, 0.1, 0.9)
+    board.update("b", 0.3, 0.25, 0.35, 0.1, 1.0)
+    board.update("c", np.nan, np.nan, np.nan, np.nan, np.nan)
+    board.update("d", 0.4, 0.35, 0.45, 0.1, 0.8)
+    assert [row[0] for row in board.sorted_rows()] == ["b", "d", "a", "c"]
+    # updating a participant moves them instead of adding a row
+    board.update("a", 0.2, 0.15, 0.25, 0.1, 0.9)
+    assert len(board) == 4
+    assert [row[0] for row in board.sorted_rows()] == ["a", "b", "d", "c"]
+
+
+def test_leaderboard_snapshot(tmp_path):
+    path = str(tmp_path / "leaderboard.csv")
+    board = Leaderboard(path, snapshot_delay=60)
+    board.update("1", 0.5, 0.45, 0.55, 0.1, 0.9)
+    board.update("2", 0.3, 0.25, 0.35, 0.1, 1.0)
+    board.snapshot()
+    df = pd.read_csv(path, dtype={"Participant": str})
+    assert df.columns.tolist() == LEADERBOARD_COLUMNS
+    assert df["Participant"].tolist() == ["2", "1"]
+    # a restarted leaderboard picks up the snapshot
+    assert Leaderboard(path).sorted_rows() == board.sorted_rows()
+
+
+def test_handler_processes_finished_files(tmp_path):
+    processed = []
+    handler = ExperimentHandler(settle_time=0.05)
+    with mock.patch(
+        "leaderboard.process_participant_data",
+        side_effect=lambda pid, pdir: processed.append(pid),
+    ), mock.patch("leaderboard.update_leaderboard_display"):
+        for i in range(20):
+            participant_dir = tmp_path / str(i)
+            participant_dir.mkdir()
+            path = participant_dir / f"{i}_data.csv"
+            path.write_text("side,valid,response,response_time\n")
+            # several events for the same file are coalesced
+            handler.on_created(FileCreatedEvent(str(path)))
+            handler.on_modified(FileModifiedEvent(str(path)))
+        handler.on_moved(FileMovedEvent(str(path) + ".part", str(path)))
+        tic = time.monotonic()
+        while len(processed) < 20 and time.monotonic() - tic < 1:
+            time.sleep(0.01)
+        handler.stop()
+    assert sorted(processed, key=int) == [str(i) for i in range(20)]
+
+
+def test_handler_ignores_other_files(tmp_path):
+    handler = ExperimentHandler(settle_time=60)
+    participant_dir = tmp_path / "1"
+    participant_dir.mkdir()
+    for name in ["1_trace.csv", "1_trace.csv.part", "other.csv", "2_data.csv"]:
+        handler.on_created(FileCreatedEvent(str(participant_dir / name)))
+    assert not handler._pending and not handler._streams
+    handler.on_created(FileCreatedEvent(str(participant_dir / "1_data.csv")))
+    handler.stop()
+    assert list(handler._pending) == [str(participant_dir)]
+
+
+def test_check_existing_data_uses_cache(write_config, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    run_simulations(write_config, 5, root_dir=tmp_path, workers=1, seed=0)
+    leaderboard.check_existing_data(workers=2)
+    assert len(leaderboard.get_leaderboard()) == 5
+    assert "0 unchanged" in capsys.readouterr().out
+    first = pd.read_csv(leaderboard.LEADERBOARD_FILE)
+
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    leaderboard.check_existing_data(workers=2)
+    assert "5 unchanged" in capsys.readouterr().out
+    pd.testing.assert_frame_equal(pd.read_csv(leaderboard.LEADERBOARD_FILE), first)
+
+
+def test_metrics_cache_of_other_version_is_ignored(write_config, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    run_simulations(write_config, 3, root_dir=tmp_path, workers=1, seed=0)
+    leaderboard.check_existing_data(workers=1)
+    with open(leaderboard.METRICS_CACHE_FILE) as f:
+        cache = json.load(f)
+    # a cache written before it had a version
+    with open(leaderboard.METRICS_CACHE_FILE, "w") as f:
+        json.dump(cache["entries"], f)
+    capsys.readouterr()
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    leaderboard.check_existing_data(workers=1)
+    assert "0 unchanged" in capsys.readouterr().out
+
+
+def test_metrics_cache_follows_session_file(write_config, tmp_path, monkeypatch, capsys):
+    pytest.importorskip("pyarrow")
+    from posner.data import write_session
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    subject_dirs = run_simulations(write_config, 3, root_dir=tmp_path, workers=1, seed=0)
+    leaderboard.check_existing_data(workers=1)
+    # a parquet file is read instead of the CSV, so its metrics are recomputed
+    subject_dir = subject_dirs[0]
+    df = pd.read_csv(subject_dir / f"{subject_dir.name}_data.csv")
+    write_session(subject_dir / f"{subject_dir.name}_data.parquet", df, {})
+    capsys.readouterr()
+    monkeypatch.setattr(leaderboard, "_leaderboard", None)
+    leaderboard.check_existing_data(workers=1)
+    assert "2 unchanged" in capsys.readouterr().out
+
+
+def test_server_pushes_changed_rows(tmp_path):
+    import http.client
+    import json
+    import urllib.request
+    from leaderboard import LeaderboardServer
+
+    board = Leaderboard(str(tmp_path / "leaderboard.csv"), snapshot_delay=60)
+    board.update("a", 0.5, 0.45, 0.55, 0.1, 0.9)
+    board.update("b", np.nan, np.nan, np.nan, np.nan, np.nan)
+    server = LeaderboardServer(board, port=0)
+    server.start()
+    url = f"http://{server.host}:{server.port}"
+    with urllib.request.urlopen(f"{url}/ranking", timeout=5) as response:
+        ranking = json.load(response)
+    assert [row["participant"] for row in ranking] == ["a", "b"]
+    assert ranking[1]["response_time"] is None
+
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    connection.request("GET", "/events")
+    response = connection.getresponse()
+    assert response.getheader("Content-Type") == "text/event-stream"
+    # the stream starts with the full ranking
+    line = response.fp.readline()
+    assert [row["participant"] for row in json.loads(line[len(b"data: "):])] == ["a", "b"]
+    assert response.fp.readline() == b"\n"
+    board.update("c", 0.3, 0.25, 0.35, 0.1, 1.0)
+    line = response.fp.readline()
+    assert line.startswith(b"data: ")
+    assert json.loads(line[len(b"data: "):]) == [
+        {
+            "participant": "c",
+            "response_time": 0.3,
+            "response_time_valid": 0.25,
+            "response_time_invalid": 0.35,
+            "response_time_difference": 0.1,
+            "accuracy": 1.0,
+        }
+    ]
+    connection.close()
+
+
+def test_server_start_raises_if_port_is_taken(tmp_path):
+    import socket
+    from leaderboard import LeaderboardServer
+
+    board = Leaderboard(str(tmp_path / "leaderboard.csv"), snapshot_delay=60)
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        server = LeaderboardServer(board, "127.0.0.1", taken.getsockname()[1])
+        with pytest.raises(OSError):
+            server.start()
+
+
+def test_render_leaderboard_uses_sorted_rows(tmp_path):
+    board = Leaderboard(str(tmp_path / "leaderboard.csv"), snapshot_delay=60)
+    board.update("slow", 0.5, 0.45, 0.55, 0.1, 0.9)
+    board.update("<b>fast</b>", 0.3, 0.25, 0.35, 0.1, 1.0)
+    with mock.patch("leaderboard.get_leaderboard", return_value=board):
+        path = str(tmp_path / "leaderboard.html")
+        leaderboard.update_leaderboard_display(path)
+    with open(path) as f:
+        html = f.read()
+    assert not (tmp_path / "leaderboard.html.tmp").exists()
+    assert html.index("&lt;b&gt;fast&lt;/b&gt;") < html.index("slow")
+    # the data attributes belong to the same row as the cells
+    assert '<tr class="gold"\n                data-rank="1"\n                data-response-time="0.3"' in html
+    assert "<td>100.0%</td>" in html
+
+
+def test_participant_stats_match_batch_metrics():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(
+        {
+            "side": rng.choice(["left", "right"], 200),
+            "valid": rng.random(200) < 0.8,
+            "response": rng.choice(["left", "right", ""], 200),
+            "response_time": rng.uniform(0.2, 0.8, 200),
+        }
+    )
+    df.loc[df["response"] == "", "response_time"] = np.nan
+    stats = leaderboard.ParticipantStats()
+    for row in df.itertuples(index=False):
+        rt = "" if np.isnan(row.response_time) else repr(row.response_time)
+        stats.add({"side": row.side, "valid": str(row.valid), "response": row.response, "response_time": rt})
+    assert np.allclose(stats.metrics(), leaderboard.compute_metrics(df))
+    correct = df["response"] == df["side"]
+    assert np.isclose(stats.response_time.variance, df[correct]["response_time"].var())
+
+
+def test_handler_streams_running_sessions(tmp_path):
+    board = Leaderboard(str(tmp_path / "leaderboard.csv"), snapshot_delay=60)
+    participant_dir = tmp_path / "p1"
+    participant_dir.mkdir()
+    path = participant_dir / "p1_data.csv"
+    part = participant_dir / "p1_data.csv.part"
+    header = "side,valid,response,response_time,fixation_onset,cue_onset,target_onset\n"
+    trials = ["left,True,left,0.3,0,1,2\n", "right,False,right,0.5,0,1,2\n"]
+
+    def wait_for(condition):
+        tic = time.monotonic()
+        while not condition() and time.monotonic() - tic < 1:
+            time.sleep(0.01)
+
+    handler = ExperimentHandler(settle_time=0.05)
+    with mock.patch("leaderboard.get_leaderboard", return_value=board), mock.patch(
+        "leaderboard.update_leaderboard_display"
+    ), mock.patch("leaderboard.process_participant_data") as process:
+        # the second trial is only partly written
+        part.write_text(header + trials[0] + trials[1][:5])
+        handler.on_modified(FileModifiedEvent(str(part)))
+        wait_for(lambda: "p1" in board.rows)
+        assert np.allclose(
+            board.rows["p1"][1:], (0.3, 0.3, np.nan, np.nan, 1.0), equal_nan=True
+        )
+        with open(part, "a") as f:
+            f.write(trials[1][5:])
+        os.replace(part, path)
+        handler.on_moved(FileMovedEvent(str(part), str(path)))
+        wait_for(lambda: board.rows["p1"][1] != 0.3)
+        handler.stop()
+    assert np.allclose(board.rows["p1"][1:], (0.4, 0.3, 0.5, 0.2, 1.0))
+    # the finished file is not read again
+    process.assert_not_called()
@@ -0,0 +1,71 @@
+import os
+import time
+from pathlib import Path
+from posner.orchestrator import Station, Supervisor, run_station
+
+
+def crash_once(station, config_file, health, n_sessions=None, simulate=False):
+    # the first start of station1 crashes, the restarted one works
+    marker = Path(config_file).parent / f"{station.name}.crashed"
+    if station.name == "station1" and not marker.exists():
+        marker.touch()
+        os._exit(3)
+    run_station(station, config_file, health, n_sessions, simulate)
+
+
+def hang_once(station, config_file, health, n_sessions=None, simulate=False):
+    # station1 hangs in its first block, station0 waits for a participant for a while
+    marker = Path(config_file).parent / f"{station.name}.hung"
+    if not marker.exists():
+        marker.touch()
+        health.put(("heartbeat", station.name, station.name == "station1"))
+        time.sleep(1 if station.name == "station0" else 60)
+    run_station(station, config_file, health, n_sessions, simulate)
+
+
+def test_supervisor_runs_and_restarts_stations(write_config, tmp_path):
+    stations = [Station("station0", 0, 0), Station("station1", 1, 1)]
+    supervisor = Supervisor(
+        write_config, stations, n_sessions=2, simulate=True, restart_delay=0, target=crash_once
+    )
+    supervisor.run(poll_interval=0.05)
+    status = supervisor.stations
+    assert [s.state for s in status.values()] == ["finished", "finished"]
+    assert [s.sessions for s in status.values()] == [2, 2]
+    assert status["station0"].restarts == 0
+    assert status["station1"].restarts == 1
+    # every station has its own log and the names don't collide
+    assert (tmp_path / "logs" / "station1.log").exists()
+    subject_dirs = sorted(p.name for p in (tmp_path / "data").iterdir())
+    assert subject_dirs == ["station0", "station0_1", "station1", "station1_1"]
+    assert "station1" in supervisor.report()
+
+
+def test_supervisor_gives_up(write_config):
+    stations = [Station("station1")]
+    supervisor = Supervisor(
+        write_config, stations, restart_delay=0, max_restarts=0, target=crash_once
+    )
+    supervisor.run(poll_interval=0.05)
+    assert supervisor.stations["station1"].state == "failed"
+    assert supervisor.stations["station1"].error == "exit code 3"
+
+
+def test_supervisor_restarts_unresponsive_stations(write_config):
+    stations = [Station("station0"), Station("station1")]
+    supervisor = Supervisor(
+        write_config,
+        stations,
+        n_sessions=1,
+        simulate=True,
+        restart_delay=0,
+        heartbeat_timeout=0.5,
+        target=hang_once,
+    )
+    supervisor.run(poll_interval=0.05)
+    status = supervisor.stations
+    assert [s.state for s in status.values()] == ["finished", "finished"]
+    # waiting for the participant is not a hang
+    assert status["station0"].restarts == 0
+    assert status["station1"].restarts == 1
+    assert status["station1"].error.startswith("no heartbeat")
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from posner.experiment import draw_sides, make_trial_sequence, longest_run
+from posner.data import save_sequence, load_sequence
+
+
+def test_sequence_is_counterbalanced(create_config):
+    sequence = make_trial_sequence(create_config, np.random.default_rng(1))
+    assert len(sequence) == create_config.n_trials
+    counts = sequence.groupby(["side", "valid"]).size()
+    n_valid = create_config.n_trials / 2 * create_config.p_valid
+    assert counts[("left", True)] == counts[("right", True)] == n_valid
+    assert counts[("left", False)] == counts[("right", False)]
+
+
+def test_sequence_is_seeded(create_config):
+    a = make_trial_sequence(create_config, np.random.default_rng(42))
+    b = make_trial_sequence(create_config, np.random.default_rng(42))
+    assert a.equals(b)
+
+
+def test_sequence_max_run_length(create_config):
+    config = create_config.model_copy(update={"max_run_length": 2})
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        sequence = make_trial_sequence(config, rng)
+        assert longest_run(sequence["side"].to_numpy()) <= 2
+
+
+@pytest.mark.parametrize("max_run_length", [1, 2, 3, 4])
+def test_long_block_max_run_length(create_config, max_run_length):
+    config = create_config.model_copy(
+        update={"n_trials": 400, "max_run_length": max_run_length}
+    )
+    sequence = make_trial_sequence(config, np.random.default_rng(0))
+    assert longest_run(sequence["side"].to_numpy()) <= max_run_length
+    counts = sequence.groupby(["side", "valid"]).size()
+    assert counts[("left", True)] == counts[("right", True)] == 160
+    assert counts[("left", False)] == counts[("right", False)] == 40
+
+
+def test_impossible_order_raises():
+    with pytest.raises(ValueError):
+        draw_sides(5, 1, 2, np.random.default_rng(0))
+
+
+def test_sequence_roundtrip(create_config, tmp_path):
+    rng = np.random.default_rng(3)
+    blocks = [make_trial_sequence(create_config, rng) for _ in range(2)]
+    save_sequence(tmp_path / "sequence.json", 3, blocks)
+    seed, loaded = load_sequence(tmp_path / "sequence.json")
+    assert seed == 3
+    assert all(a.equals(b) for a, b in zip(blocks, loaded))
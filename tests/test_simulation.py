@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+from posner.simulation import simulate_session, run_simulations
+
+
+def test_simulate_session(write_config):
+    from posner.config import load_config
+
+    config = load_config(write_config).model_copy(update={"timing": "frames"})
+    subject_dir = simulate_session(config, "sim", seed=1, cueing_effect=0.2)
+    df = pd.read_csv(subject_dir / "sim_data.csv")
+    assert len(df) == config.n_blocks * config.n_trials
+    assert df["response"].isin(["left", "right"]).all()
+    rt = df.groupby("valid")["response_time"].mean()
+    assert rt[False] > rt[True]
+    # frame-locked onsets follow the configured durations on the virtual clock
+    fix_dur = df["cue_onset"] - df["fixation_onset"]
+    assert (fix_dur - config.fix_dur).abs().max() < 1e-9
+
+
+def test_run_simulations(write_config, tmp_path):
+    subject_dirs = run_simulations(write_config, 3, root_dir=tmp_path, workers=1, seed=0)
+    assert len(subject_dirs) == 3
+    for subject_dir in subject_dirs:
+        assert (subject_dir / f"{subject_dir.name}_data.csv").exists()
+
+
+def test_simulated_names_do_not_collide(write_config):
+    from posner.config import load_config
+
+    config = load_config(write_config)
+    first = simulate_session(config, "sim", seed=1)
+    second = simulate_session(config, "sim", seed=1)
+    assert first != second
+
+
+def test_simulated_session_format(write_config):
+    pytest.importorskip("pyarrow")
+    from posner.config import load_config
+    from posner.data import read_session
+
+    config = load_config(write_config).model_copy(update={"session_format": "parquet"})
+    subject_dir = simulate_session(config, "sim", seed=2)
+    df, metadata = read_session(subject_dir / "sim_data.parquet")
+    csv = pd.read_csv(subject_dir / "sim_data.csv")
+    assert len(df) == len(csv)
+    assert np.allclose(df["response_time"], csv["response_time"])
+    assert metadata["seed"] == 2
+    assert metadata["config"]["n_trials"] == config.n_trials
+
+
+def test_replay_reproduces_session(write_config, tmp_path):
+    from posner.cli import main_cli
+    from posner.config import load_config
+    from posner.simulation import replay_session
+
+    config = load_config(write_config)
+    subject_dir = simulate_session(config, "sim", seed=5)
+    saved = load_config(subject_dir / "sim_config.json", acquire_devices=False)
+    assert saved.seed == 5
+    replay_dir = replay_session(subject_dir, root_dir=tmp_path / "replay")
+    original = pd.read_csv(subject_dir / "sim_data.csv")
+    replayed = pd.read_csv(replay_dir / "sim_data.csv")
+    pd.testing.assert_frame_equal(original, replayed)
+    main_cli(["replay", str(subject_dir), "--root-dir", str(tmp_path / "cli")])
+
+
+def test_simulate_cli_runs_without_display(write_config):
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if name not in ("DISPLAY", "WAYLAND_DISPLAY") and not name.startswith("PYGLET_")
+    }
+    code = (
+        "import sys\n"
+        "from posner.cli import main_cli\n"
+        "main_cli(sys.argv[1:])\n"
+        "print(','.join(m for m in ['pyglet', 'pygame'] if m in sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, "simulate", write_config, "--workers", "1", "--seed", "0"],
+        capture_output=True, text=True, env=env,
+    )
+    assert out.returncode == 0, out.stderr
+    lines = out.stdout.splitlines()
+    assert lines[0].startswith("Simulated 1 sessions")
+    # the simulated backend never loads the display or controller libraries
+    assert lines[1] == ""
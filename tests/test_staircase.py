@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from psychopy import core
+from posner.config import Config
+from posner.experiment import run_block
+from posner.staircase import WeightedUpDown
+
+
+def test_staircase_converges_to_target_accuracy():
+    rng = np.random.default_rng(0)
+    staircase = WeightedUpDown(start=0.9, step=0.01, target=0.75, minimum=0, maximum=1)
+    values = []
+    for _ in range(5000):
+        # a participant whose accuracy grows linearly with the value
+        p_correct = 0.5 + 0.5 * staircase.value
+        staircase.update(rng.random() < p_correct)
+        values.append(staircase.value)
+    # 75% correct at a value of 0.5
+    assert np.mean(values[1000:]) == pytest.approx(0.5, abs=0.05)
+
+
+def test_staircase_stays_in_range():
+    staircase = WeightedUpDown(start=0.1, step=0.05, minimum=0.05, maximum=0.2)
+    for _ in range(5):
+        staircase.update(True)
+    assert staircase.value == 0.05
+    for _ in range(5):
+        staircase.update(False)
+    assert staircase.value == 0.2
+    assert staircase.n_updates == 10
+
+
+def test_config_rejects_empty_range(config_dict):
+    config_dict["staircase"] = {"parameter": "cue_dur", "step": 0.1, "minimum": 0.5, "maximum": 0.2}
+    with pytest.raises(ValueError):
+        Config(**config_dict)
+
+
+def test_start_is_in_range(config_dict):
+    config_dict["staircase"] = {"parameter": "cue_dur", "step": 0.1, "start": 0.8, "maximum": 0.5}
+    with pytest.raises(ValueError):
+        Config(**config_dict)
+    # the defaults of start are clamped instead
+    assert WeightedUpDown(start=1.0, step=0.1, maximum=0.5).value == 0.5
+    assert WeightedUpDown(start=0.0, step=0.1, minimum=0.2).value == 0.2
+
+
+def test_run_block_logs_staircase(
+    config_dict, mock_window, mock_circle, mock_rect, mock_waitKeys
+):
+    config_dict["staircase"] = {"parameter": "cue_dur", "step": 0.05, "target": 0.5}
+    config = Config(**config_dict)
+    mock_waitKeys.side_effect = lambda keyList, maxWait=None: ["left"]
+    df = run_block(mock_window, core.Clock(), config)
+    values = df["staircase_value"].to_numpy()
+    assert values[0] == config.cue_dur
+    # with target 0.5 the steps up and down are equal
+    correct = (df["response"] == df["side"]).to_numpy()
+    expected = values[0] + np.concatenate([[0], np.cumsum(np.where(correct, -0.05, 0.05))[:-1]])
+    assert np.allclose(values, expected)
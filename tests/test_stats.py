@@ -0,0 +1,89 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from posner.cli import main_cli
+from posner.simulation import run_simulations
+from posner.stats import MIN_RT, participant_stats
+
+
+def make_trials(n_participants, n_trials, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_participants * n_trials
+    side = rng.choice(["left", "right"], n)
+    response = np.where(rng.random(n) < 0.9, side, "left").astype(object)
+    response_time = rng.uniform(0.05, 1.0, n)
+    # timeouts have no response
+    timeout = rng.random(n) < 0.05
+    response[timeout] = None
+    response_time[timeout] = 2.0
+    return pd.DataFrame(
+        {
+            "participant": np.repeat([f"p{i}" for i in range(n_participants)], n_trials),
+            "side": side,
+            "valid": rng.random(n) < 0.8,
+            "response": response,
+            "response_time": response_time,
+        }
+    )
+
+
+def trim_mean(values, trim):
+    values = np.sort(values)
+    cut = int(trim * len(values))
+    return values[cut : len(values) - cut].mean()
+
+
+def test_participant_stats_match_per_participant_loop():
+    df = make_trials(20, 57)
+    stats = participant_stats(df)
+    for participant, trials in df.groupby("participant"):
+        used = trials[(trials["response"] == trials["side"]) & (trials["response_time"] >= MIN_RT)]
+        valid = used[used["valid"]]["response_time"]
+        invalid = used[~used["valid"]]["response_time"]
+        row = stats.loc[participant]
+        assert row["n_trials"] == len(trials)
+        assert row["accuracy"] == pytest.approx((trials["response"] == trials["side"]).mean())
+        assert row["n_rt"] == len(used)
+        assert row["mean_rt"] == pytest.approx(used["response_time"].mean())
+        assert row["median_rt"] == pytest.approx(used["response_time"].median())
+        assert row["trimmed_mean_rt"] == pytest.approx(trim_mean(used["response_time"], 0.1))
+        assert row["median_rt_valid"] == pytest.approx(valid.median())
+        assert row["trimmed_mean_rt_invalid"] == pytest.approx(trim_mean(invalid, 0.1))
+        assert row["cueing_effect"] == pytest.approx(invalid.median() - valid.median())
+
+
+def test_participant_without_rts():
+    df = make_trials(2, 10)
+    df.loc[df["participant"] == "p1", "response"] = None
+    stats = participant_stats(df)
+    assert stats.loc["p1", "accuracy"] == 0
+    assert stats.loc["p1", "n_rt"] == 0
+    assert np.isnan(stats.loc["p1", ["mean_rt", "median_rt", "trimmed_mean_rt"]]).all()
+    assert not np.isnan(stats.loc["p0", "median_rt"])
+
+
+def test_bootstrap_interval():
+    df = make_trials(5, 200)
+    stats = participant_stats(df, n_boot=500, rng=np.random.default_rng(0))
+    assert (stats["cueing_effect_low"] <= stats["cueing_effect"]).all()
+    assert (stats["cueing_effect"] <= stats["cueing_effect_high"]).all()
+
+
+def test_participant_stats_benchmark():
+    df = make_trials(2000, 100)
+    tic = time.perf_counter()
+    stats = participant_stats(df)
+    elapsed = time.perf_counter() - tic
+    print(f"Statistics of 2000 sessions in {elapsed * 1000:.1f} ms")
+    assert len(stats) == 2000
+    assert elapsed < 0.5
+
+
+def test_stats_cli(write_config, tmp_path):
+    run_simulations(write_config, 3, workers=1, seed=0, cueing_effect=0.2)
+    output = tmp_path / "stats.csv"
+    main_cli(["stats", str(tmp_path / "data"), "--output", str(output)])
+    stats = pd.read_csv(output, index_col="participant")
+    assert len(stats) == 3
+    assert (stats["cueing_effect"] > 0).all()
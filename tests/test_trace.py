@@ -0,0 +1,65 @@
+import json
+import numpy as np
+import pytest
+from posner.cli import main_cli
+from posner.config import Config
+from posner.simulation import simulate_session
+from posner.trace import Tracer, load_trace, summarize
+
+
+def make_trace():
+    tracer = Tracer()
+    tracer.start_block()
+    for trial in range(3):
+        tracer.start_trial()
+        start = trial * 2.0
+        tracer.add_flips({"fixation": [start], "cue": [start + 0.5], "target": [start + 1.0]})
+        tracer.add("input_latency", "input", start + 1.0, 0.001)
+        tracer.add("response", "input", start + 1.001, 0.4, response="left")
+    return tracer
+
+
+@pytest.mark.parametrize("suffix", ["json", "csv"])
+def test_trace_roundtrip(tmp_path, suffix):
+    tracer = make_trace()
+    path = tmp_path / f"trace.{suffix}"
+    tracer.save(path)
+    trace = load_trace(path)
+    assert len(trace) == len(tracer.events)
+    assert trace["args"][2] == {"phase": "target", "frame": 0}
+    assert np.allclose(trace["start"], tracer.to_frame()["start"])
+    if suffix == "json":
+        events = json.load(open(path))["traceEvents"]
+        assert {event["ph"] for event in events} == {"i", "X"}
+
+
+def test_summarize():
+    summary = summarize(make_trace().to_frame())
+    assert summary.loc["fixation", "mean"] == pytest.approx(500)
+    assert summary.loc["input_latency", "max"] == pytest.approx(1)
+    # from the end of the response at 1.401 s to the next fixation at 2 s
+    assert summary.loc["trial_gap", "count"] == 2
+    assert summary.loc["trial_gap", "p50"] == pytest.approx(599)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("trial", "trial"):
+        tracer.add_flips({"fixation": [0.0]})
+    assert tracer.events == []
+
+
+def test_session_trace(config_dict, tmp_path, capsys):
+    config_dict.update(root_dir=str(tmp_path), trace="json", timing="frames", refresh_rate=60)
+    config = Config.model_validate(config_dict)
+    subject_dir = simulate_session(config, "sim", seed=1)
+    path = subject_dir / "sim_trace.json"
+    summary = summarize(load_trace(path))
+    n_trials = config.n_blocks * config.n_trials
+    assert summary.loc["cue", "count"] == n_trials
+    assert summary.loc["cue", "mean"] == pytest.approx(config.cue_dur * 1000)
+    assert summary.loc["frame_interval", "max"] == pytest.approx(1000 / 60)
+    # the break between blocks is no trial gap
+    assert summary.loc["trial_gap", "count"] == n_trials - config.n_blocks
+    main_cli(["timing", str(path)])
+    assert "frame_interval" in capsys.readouterr().out
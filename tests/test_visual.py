@@ -1,4 +1,11 @@
-from posner.experiment import draw_fixation, draw_text, draw_frames, draw_stimulus
+from unittest import mock
+from posner.experiment import (
+    draw_fixation,
+    draw_text,
+    draw_frames,
+    draw_stimulus,
+    Stimuli,
+)
 
 
 def test_draw_fixation(create_config, mock_window, mock_circle):
@@ -33,3 +40,18 @@ def test_draw_stimulus(create_config, mock_window, mock_circle):
     assert kwargs["pos"][0] == create_config.pos.left[0]
     assert kwargs["size"] == (1 / mock_window.aspect, 1)
     assert kwargs["radius"] == create_config.stim_radius
+
+
+def test_stimuli_are_reused(create_config, mock_window, mock_circle, mock_rect):
+    mock_rect.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    mock_circle.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    stimuli = Stimuli(mock_window, create_config)
+    for _ in range(5):
+        stimuli.draw_frames(highlight="left")
+        stimuli.draw_fixation()
+        stimuli.draw_stimulus("right")
+    assert mock_rect.call_count == 4
+    assert mock_circle.call_count == 3
+    assert stimuli.highlighted_frames["left"].draw.call_count == 5
+    assert stimuli.frames["right"].draw.call_count == 5
+    assert stimuli.targets["right"].draw.call_count == 5